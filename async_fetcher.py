@@ -0,0 +1,74 @@
+from collections import Counter
+from collections import namedtuple
+import asyncio
+import logging
+
+import aiohttp
+
+from config import ASYNC_FETCH_CONCURRENCY
+from http_client import create_async_session
+from rate_controller import controller
+from rate_controller import parse_retry_after
+from retry_scheduler import classify_status
+
+
+logger = logging.getLogger(__name__)
+
+FetchResult = namedtuple('FetchResult', ['status', 'headers', 'body'])
+
+async def _fetch_one(session, semaphore, key, url, headers, on_response, retry_policy):
+    attempts = Counter()
+    while True:
+        async with semaphore:
+            target = await url() if callable(url) else url  # May wait, e.g. while the URL segment is re-resolved
+            ticket = await controller.acquire_async()
+            status, retry_after, result, error = None, None, None, None
+            try:
+                async with session.get(target, headers=headers) as response:
+                    status, retry_after = response.status, parse_retry_after(response.headers.get('Retry-After'))
+                    body = await response.read() if response.status == 200 else b''
+                    result = FetchResult(response.status, response.headers, body)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            finally:
+                controller.release(ticket, status, retry_after)
+        error_class = classify_status(status)
+        if retry_policy is None or error_class is None:
+            break
+        attempts[error_class] += 1
+        delay = retry_policy.delay(error_class, attempts[error_class], retry_after)
+        if delay is None:
+            retry_policy.give_up(key, error_class, attempts[error_class] - 1, str(error or f"HTTP {status}"))
+            break
+        logging.warning(f"Retrying {target} in {delay:.1f}s after {error_class} error ({error or status})")
+        await asyncio.sleep(delay)  # Outside the semaphore, so healthy requests keep flowing meanwhile
+    if result is None:
+        logging.error(f"Request error while fetching {target}: {error}")
+        return
+    if retry_policy is not None and classify_status(result.status) is None:
+        retry_policy.settled(key)
+    on_response(key, result)
+
+async def _fetch_all(requests, on_response, concurrency, retry_policy):
+    semaphore = asyncio.Semaphore(concurrency)
+    async with create_async_session(concurrency) as session:
+        await asyncio.gather(*(_fetch_one(session, semaphore, key, url, headers, on_response, retry_policy)
+                               for key, url, headers in requests))
+
+def fetch_all(requests, on_response, concurrency=ASYNC_FETCH_CONCURRENCY, retry_policy=None):
+    """Fetch (key, url, headers) requests concurrently and call on_response(key, FetchResult) for each.
+
+    url may also be a coroutine function returning the URL; it is awaited
+    once a concurrency slot is free, just before each attempt is sent.
+    With a RetryPolicy, failed requests and throttled or 5xx responses are
+    retried after its backoff and dead-lettered once its budget is spent.
+
+    Callbacks run on the event loop thread one at a time and must not block
+    it; cache writes from them go through the shared CacheWriter like every
+    other database write.
+    """
+    requests = list(requests)
+    if not requests:
+        return
+    logging.info(f"Fetching {len(requests)} URLs with up to {concurrency} connections, paced by the rate controller")
+    asyncio.run(_fetch_all(requests, on_response, concurrency, retry_policy))
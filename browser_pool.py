@@ -0,0 +1,102 @@
+from concurrent.futures import Future
+import queue
+import threading
+import logging
+
+from selenium.common.exceptions import WebDriverException
+
+from config import BROWSER_POOL_SIZE
+from config import BROWSER_MAX_PAGES
+from config import BROWSER_MAX_HEAP_MB
+
+
+logger = logging.getLogger(__name__)
+
+class BrowserPool:
+    """A fixed number of long-lived Chrome instances serving a shared work queue.
+
+    Tasks are callables taking the driver as first argument. Each worker
+    starts its browser on its first task, checks it is responsive before
+    every task, and replaces it after max_pages tasks or once the page's
+    JS heap grows beyond max_heap_mb.
+    """
+
+    _STOP = object()
+
+    def __init__(self, driver_factory, size=BROWSER_POOL_SIZE, max_pages=BROWSER_MAX_PAGES,
+                 max_heap_mb=BROWSER_MAX_HEAP_MB):
+        self.driver_factory = driver_factory
+        self.size = size
+        self.max_pages = max_pages
+        self.max_heap_bytes = max_heap_mb * 1024 * 1024
+        self._tasks = queue.Queue()
+        self._workers = [threading.Thread(target=self._work, name=f'browser-{i}', daemon=True) for i in range(size)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self._tasks.put((future, fn, args, kwargs))
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Run fn(driver, *args, **kwargs) on a pooled browser and wait for the result."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def close(self):
+        for _ in self._workers:
+            self._tasks.put(self._STOP)
+        for worker in self._workers:
+            worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _work(self):
+        driver = None
+        pages = 0
+        while True:
+            item = self._tasks.get()
+            if item is self._STOP:
+                break
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if driver is not None and not self._is_healthy(driver, pages):
+                    self._quit(driver)
+                    driver = None
+                if driver is None:
+                    driver = self.driver_factory()
+                    pages = 0
+                result = fn(driver, *args, **kwargs)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            pages += 1
+        if driver is not None:
+            self._quit(driver)
+
+    def _is_healthy(self, driver, pages):
+        if pages >= self.max_pages:
+            logging.info(f"Recycling browser after {pages} pages")
+            return False
+        try:
+            heap = driver.execute_script("return performance.memory ? performance.memory.usedJSHeapSize : 0")
+        except WebDriverException as e:
+            logging.warning(f"Browser failed health check, recycling: {e}")
+            return False
+        if heap and heap > self.max_heap_bytes:
+            logging.info(f"Recycling browser with {heap // (1024 * 1024)} MB JS heap")
+            return False
+        return True
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except WebDriverException as e:
+            logging.warning(f"Error closing browser: {e}")
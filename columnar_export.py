@@ -0,0 +1,147 @@
+from collections import Counter
+import csv
+import re
+import threading
+import logging
+
+from config import EXPORT_ROW_GROUP_SIZE
+from csv_handler import CSV_HEADERS
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+logger = logging.getLogger(__name__)
+
+# Columns not listed here are exported as strings (Parquet dictionary-encodes them on disk)
+NUMERIC_COLUMNS = ('price', 'spec_inflatable_pressure', 'spec_tread_depth', 'spec_tread_width')
+# Strings whose number carries a prefix (e.g. 'P275', 'LT285'): kept as is, with the number added as <name>_value
+PREFIXED_NUMERIC_COLUMNS = ('spec_width',)
+MISSING_VALUES = ('', 'NA')
+
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+def _to_float(value):
+    """Return value as a float, None if it is missing; raises ValueError for anything else."""
+    if value is None or value in MISSING_VALUES:
+        return None
+    return float(value)
+
+def _number_in(value):
+    """Return the first number in a prefixed value such as 'LT285', None if it is missing."""
+    if value is None or value in MISSING_VALUES:
+        return None
+    match = _NUMBER_RE.search(str(value))
+    if match is None:
+        raise ValueError(f"no number in {value!r}")
+    return float(match.group())
+
+def _to_str(value):
+    return None if value is None else str(value)
+
+def export_columns():
+    """Return (name, CSV column index, arrow type, converter) for each exported column."""
+    columns = []
+    for index, name in enumerate(CSV_HEADERS):
+        if name in NUMERIC_COLUMNS:
+            columns.append((name, index, pa.float64(), _to_float))
+        else:
+            columns.append((name, index, pa.string(), _to_str))
+        if name in PREFIXED_NUMERIC_COLUMNS:
+            columns.append((f"{name}_value", index, pa.float64(), _number_in))
+    return columns
+
+def export_schema():
+    return pa.schema([(name, arrow_type) for name, _, arrow_type, _ in export_columns()])
+
+class ColumnarSink:
+    """Typed Parquet or Arrow IPC export of the CSV rows, written one row group at a time.
+
+    Values a numeric column cannot parse are exported as null, logged and
+    counted per column in the summary logged on close.
+    """
+
+    FORMATS = ('parquet', 'arrow')
+
+    def __init__(self, path, export_format='parquet', row_group_size=EXPORT_ROW_GROUP_SIZE):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for columnar export")
+        if export_format not in self.FORMATS:
+            raise ValueError(f"Unsupported columnar export format: {export_format}")
+        self.path = path
+        self.row_group_size = row_group_size
+        self.columns = export_columns()
+        self.schema = export_schema()
+        self.unparsed = Counter()
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._closed = False
+        if export_format == 'parquet':
+            self._writer = pq.ParquetWriter(path, self.schema)
+            self._write_table = lambda table: self._writer.write_table(table, row_group_size=self.row_group_size)
+        else:
+            self._writer = pa.ipc.new_file(path, self.schema)
+            self._write_table = self._writer.write_table
+        logging.info(f"Writing {export_format} export to {path}")
+
+    def write_rows(self, rows, token=None):
+        with self._lock:
+            self._buffer.extend(rows)
+            if len(self._buffer) >= self.row_group_size:
+                self._flush()
+
+    def write_csv_rows(self, csv_file_path):
+        """Export the data rows already in a CSV file, e.g. those a crashed run flushed before it stopped."""
+        with open(csv_file_path, newline='') as file:
+            reader = csv.reader(file)
+            next(reader, None)  # Header
+            chunk = []
+            for row in reader:
+                chunk.append(row)
+                if len(chunk) >= self.row_group_size:
+                    self.write_rows(chunk)
+                    chunk = []
+            self.write_rows(chunk)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._flush()
+            self._writer.close()
+            self._closed = True
+        if self.unparsed:
+            logging.warning(f"Exported as null because they are not numbers: "
+                            f"{', '.join(f'{count} {name}' for name, count in self.unparsed.items())}")
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        columns = [[self._convert(name, convert, row[index]) for row in self._buffer]
+                   for name, index, _, convert in self.columns]
+        self._write_table(pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, self.schema)], schema=self.schema))
+        self._buffer.clear()
+
+    def _convert(self, name, convert, value):
+        try:
+            return convert(value)
+        except (TypeError, ValueError):
+            if not self.unparsed[name]:
+                logging.warning(f"Exporting non-numeric {name} value {value!r} as null")
+            self.unparsed[name] += 1
+            return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,9 +1,56 @@
 DATA_DIR = 'data'
 DB_PATH = 'scraper_cache.db'
+DB_SYNCHRONOUS = 'NORMAL' # OFF, NORMAL or FULL
+DB_WRITE_BATCH_SIZE = 200 # statements per commit
+DB_WRITE_BATCH_INTERVAL = 1.0 # seconds before a partial batch is committed
 CACHE_DURATION_DAYS = 7
-RATE_LIMIT = 0 # seconds
-SCRAPE_ATTEMPTS = 3
+SIZE_REFRESH_MIN_DAYS = 1 # refresh interval of sizes whose top picks change on every fetch
+SIZE_REFRESH_MAX_DAYS = 30 # refresh interval of sizes whose top picks never change
+SIZE_VOLATILITY_SMOOTHING = 0.3 # weight of the latest fetch in a size's volatility
+SIZE_REFRESH_MAX_REQUESTS = None # sizes refreshed per run, most overdue first; None refreshes all due sizes
+SIZE_REFRESH_TIME_BUDGET = None # seconds the size refresh may take per run, None for no limit
+SIZE_REFRESH_CHUNK = 100 # sizes started together when a time budget is set
+SIZE_PAGE_WORKERS = 4 # threads that decode, compress and store fetched size pages off the event loop
+PAYLOAD_COMPRESSION_LEVEL = 6 # zstd level, capped at 9 when falling back to zlib
+PAYLOAD_DICT_SIZE = 112640 # bytes
+PAYLOAD_DICT_SAMPLES = 2000 # payloads sampled to train the zstd dictionary
+PAYLOAD_DICT_MIN_PAYLOADS = 500 # cached payloads needed before a run trains the first dictionary
+RETRY_BUDGETS = {'network': 4, 'server': 3, 'throttled': 5, 'browser': 2, 'segment': 2, 'worker': 2} # retries per error class
+RETRY_BASE_DELAY = 1.0 # seconds before the first retry, doubled for each further one
+RETRY_MAX_DELAY = 60 # seconds
+SEGMENT_NOT_FOUND_THRESHOLD = 5 # _next/data 404s that trigger re-resolving the URL segment
+SEGMENT_MAX_REFRESHES = 2 # times failed sizes are requeued after the URL segment changed
+BROWSER_POOL_SIZE = 2 # Chrome instances used for browser-only fetches
+BROWSER_MAX_PAGES = 200 # pages served before a browser is replaced
+BROWSER_MAX_HEAP_MB = 512 # JS heap size that triggers replacing a browser
+BROWSER_FETCH_MODE = 'batch' # 'batch' runs fetch() calls in the loaded page, 'navigate' loads each URL
+BROWSER_FETCH_BATCH_SIZE = 20 # URLs per in-browser fetch batch
+BROWSER_FETCH_SCRIPT_TIMEOUT = 60 # seconds allowed for one batch
+DOWNLOAD_QUEUE_SIZE = 100 # downloaded payloads buffered between scraping and CSV writing
+CSV_CONSUMERS = 1 # threads converting downloaded payloads to CSV rows
+EXTRACT_PROCESSES = 0 # >0 parses payloads in a process pool instead of the CSV_CONSUMERS threads
+EXTRACT_BACKLOG_PER_PROCESS = 4 # payloads in flight per extraction process
+CSV_FLUSH_ROWS = 500 # buffered CSV rows before a write
+CSV_FLUSH_INTERVAL = 5 # seconds between CSV writes while rows are buffered
+COLUMNAR_EXPORT = None # 'parquet' or 'arrow' to also write a typed export next to the CSV (needs pyarrow)
+EXPORT_ROW_GROUP_SIZE = 10000 # rows per Parquet row group / Arrow record batch
+SAVE_RAW_JSON = True # also write each product payload to DATA_DIR (in the background)
 LOG_FILE = 'scraper_log.log'
+JSON_BACKEND = 'auto' # 'orjson', 'msgspec' or 'json'; auto picks the fastest installed
+ASYNC_FETCH_CONCURRENCY = 20
+RATE_INITIAL = 5 # requests per second to start with, adapted during the run
+RATE_MIN = 0.5 # requests per second
+RATE_MAX = 50 # requests per second
+RATE_CONCURRENCY_INITIAL = 5 # requests in flight to start with
+RATE_CONCURRENCY_MAX = 10 # also the number of product detail worker threads
+RATE_LATENCY_P95_TARGET = 2.0 # seconds; slower windows reduce the rate
+RATE_BROWSER_LATENCY_P95_TARGET = 15.0 # seconds per browser page navigation, held to its own target
+RATE_ERROR_RATE_TARGET = 0.05 # share of failed responses tolerated per window
+RATE_WINDOW = 20 # responses per adjustment
+KEEPALIVE_TIMEOUT = 30 # seconds
+HTTP_POOL_CONNECTIONS = 4 # number of hosts to keep connection pools for
+HTTP_POOL_MAXSIZE = 10 # keep-alive connections per host, should be >= worker count
+REQUEST_TIMEOUT = 30 # seconds
 SIZES = [
     "325-50r15",
     "155r13",
@@ -1,75 +1,186 @@
-import os
-import json
 import csv
+import os
+import threading
+import time
 import logging
 
 from config import SIZES
+from config import CSV_FLUSH_ROWS
+from config import CSV_FLUSH_INTERVAL
+import json_codec
 
 
 logger = logging.getLogger(__name__)
 
-# JSON Processing and CSV Writing
-def extract_product_details_data_and_write_to_csv(json_file, csv_file_path):
-    logging.info(f"Processing JSON file: {json_file}")
-    try:
-        with open(json_file, 'r') as file:
-            data = json.load(file)
-            logging.debug(f"Data loaded from JSON file: {json_file}")
-    except Exception as e:
-        logging.error(f"Error reading JSON file {json_file}: {e}")
-        return
+# CSV column -> label in a size's specList
+SPEC_COLUMNS = (
+    ('spec_width', 'Width'),
+    ('spec_ratio', 'Ratio'),
+    ('spec_inflatable_pressure', 'Inflation Pressure'),
+    ('spec_tread_depth', 'Tread Depth'),
+    ('spec_width_range', 'Width Range'),
+    ('spec_sidewall', 'Sidewall'),
+    ('spec_tread_width', 'Tread Width'),
+)
+SPEC_LABELS = tuple(label for _, label in SPEC_COLUMNS)
+# siteQueryParams copied into the product link fragment, in order, before tireSize
+PRODUCT_LINK_PARAMS = ('curationPos', 'curationSeq', 'curationSource', 'mpn', 'pageSource', 'productPos', 'region')
+
+CSV_HEADERS = (['searched_tire_size', 'tire_size', 'brand', 'product_name', 'price', 'model']
+               + [column for column, _ in SPEC_COLUMNS]
+               + ['side_tread_image_url', 'product_link'])
+
+class CsvSink:
+    """Long-lived, thread-safe CSV output.
+
+    Keeps one handle open for the whole run, writes the header once when
+    the file is empty and buffers rows until flush_rows rows are pending or
+    flush_interval seconds have passed since the last flush. A timer thread
+    also flushes on that interval, so rows are not held while no new rows
+    arrive. Tokens passed with rows are handed to on_flush(tokens, offset)
+    once those rows are synced to disk, offset being the file size then.
+    """
+
+    def __init__(self, csv_file_path, flush_rows=CSV_FLUSH_ROWS, flush_interval=CSV_FLUSH_INTERVAL, on_flush=None):
+        self.csv_file_path = csv_file_path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._tokens = []
+        self._file = open(csv_file_path, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        self._last_flush = time.monotonic()
+        if self._file.tell() == 0:
+            self._writer.writerow(CSV_HEADERS)
+            logging.info("CSV headers written.")
+        self._stop = threading.Event()
+        self._timer = threading.Thread(target=self._flush_periodically, name='csv-flush', daemon=True)
+        self._timer.start()
+
+    def write_rows(self, rows, token=None):
+        with self._lock:
+            self._buffer.extend(rows)
+            if token is not None:
+                self._tokens.append(token)
+            if len(self._buffer) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        self._stop.set()
+        self._timer.join()
+        with self._lock:
+            if self._file.closed:
+                return
+            self._flush()
+            self._file.close()
+
+    def _flush_periodically(self):
+        delay = self.flush_interval
+        while not self._stop.wait(delay):
+            with self._lock:
+                delay = self._last_flush + self.flush_interval - time.monotonic()
+                if delay <= 0:
+                    if self._buffer or self._tokens:
+                        self._flush()
+                    delay = self.flush_interval
+
+    def _flush(self):
+        if self._buffer:
+            self._writer.writerows(self._buffer)
+            self._buffer.clear()
+        self._file.flush()
+        self._last_flush = time.monotonic()
+        if self._tokens:
+            tokens, self._tokens = self._tokens, []
+            if self.on_flush is not None:
+                os.fsync(self._file.fileno())  # on_flush may commit a journal that must not point past the data
+                self.on_flush(tokens, self._file.tell())
+
+    def __enter__(self):
+        return self
 
-    available_sizes = data.get('siteProductLineAvailableSizeList', [])
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class SinkGroup:
+    """Forwards rows to several sinks, e.g. the CSV file and a columnar export."""
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def write_rows(self, rows, token=None):
+        for sink in self.sinks:
+            sink.write_rows(rows, token)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def _slug(value):
+    return value.lower().replace(' ', '-')
+
+def extract_product_rows(data):
+    """Build the CSV rows for one product-detail payload.
+
+    Product-level fields (brand, name, sidetread image, link base) are
+    computed once; each size only contributes its own fields.
+    """
     product_line = data.get('siteProductLine', {})
-    product_brand = product_line.get('brand', {}).get('label', '')
+    brand = product_line.get('brand', {}).get('label', '')
+    product_name = product_line.get('name', '')
+    side_tread_image_url = None
+    for asset in product_line.get('assetList', []):
+        if asset.get('productImageType') == 'sidetread':
+            side_tread_image_url = asset['image']['src']
+            break
+    product_link_base = f"https://simpletire.com/brands/{_slug(brand)}-tires/{_slug(product_name)}#"
+
+    rows = []
+    for size in data.get('siteProductLineAvailableSizeList', []):
+        query_params = size.get('siteQueryParams', {})
+        tire_size = query_params.get('tireSize', '')
+        specs = {spec.get('label', ''): spec.get('value', '') for spec in size.get('specList', [])}
+        link_params = '&'.join(f"{name}={query_params.get(name, '')}" for name in PRODUCT_LINK_PARAMS)
+        row = [size.get('size', ''), tire_size, brand, product_name,
+               float(size.get('priceInCents', 0)) / 100,  # Convert cents to dollars
+               size.get('partNumber', '')]
+        row.extend(specs.get(label, '') for label in SPEC_LABELS)
+        row.append(side_tread_image_url)
+        row.append(f"{product_link_base}{link_params}&tireSize={_slug(tire_size)}")
+        rows.append(row)
+    return rows
 
-    write_header = not os.path.exists(csv_file_path) or os.stat(csv_file_path).st_size == 0
-    
+def parse_product_rows(payload):
+    """Decode a raw JSON (or already parsed) product-detail payload and build its rows.
+
+    Module-level so it can run in extraction worker processes.
+    """
+    if isinstance(payload, (str, bytes)):
+        payload = json_codec.decode_product_detail(payload)
+    return extract_product_rows(payload)
+
+def write_product_details_to_csv(payload, sink, source, token=None):
+    """Write the rows for one product-detail payload; source is only used for logging."""
     try:
-        with open(csv_file_path, 'a', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            if write_header:
-                headers = ['searched_tire_size', 'tire_size', 'brand', 'product_name', 'price', 'model', 'spec_width', 'spec_ratio', 'spec_inflatable_pressure', 'spec_tread_depth', 'spec_width_range', 'spec_sidewall', 'spec_tread_width', 'side_tread_image_url', 'product_link']
-                writer.writerow(headers)
-                logging.info("CSV headers written.")
-            
-            for size in available_sizes:
-                searched_tire_size = size.get('size', '')
-                tire_size = size.get('siteQueryParams', {}).get('tireSize', '')
-                brand = product_brand
-                product_name = product_line.get('name', '')
-                model = size.get('partNumber', '')
-                price = float(size.get('priceInCents', 0)) / 100  # Convert cents to dollars
-                side_tread_image_url = None
-                
-                for asset in product_line.get('assetList', []):
-                    if asset.get('productImageType') == 'sidetread':
-                        side_tread_image_url = asset['image']['src']
-                        break
-                
-                spec_dict = {spec.get('label', ''): spec.get('value', '') for spec in size.get('specList', [])}
-                spec_width = spec_dict.get('Width', '')
-                spec_ratio = spec_dict.get('Ratio', '')
-                spec_inflatable_pressure = spec_dict.get('Inflation Pressure', '')
-                spec_tread_depth = spec_dict.get('Tread Depth', '')
-                spec_width_range = spec_dict.get('Width Range', '')
-                spec_sidewall = spec_dict.get('Sidewall', '')
-                spec_tread_width = spec_dict.get('Tread Width', '')
-                spec_tread_width = spec_dict.get('Tread Width', '')
-
-
-                query_params = size.get('siteQueryParams', {})
-                mpn = query_params.get('mpn', '')
-
-                product_link_base = f"https://simpletire.com/brands/{brand.lower().replace(' ', '-')}-tires/{product_name.lower().replace(' ', '-')}"
-                product_link_params = f"curationPos={query_params.get('curationPos', '')}&curationSeq={query_params.get('curationSeq', '')}&curationSource={query_params.get('curationSource', '')}&mpn={mpn}&pageSource={query_params.get('pageSource', '')}&productPos={query_params.get('productPos', '')}&region={query_params.get('region', '')}&tireSize={tire_size.replace(' ', '-').lower()}"
-                product_link = f"{product_link_base}#{product_link_params}"
-
-                row = [searched_tire_size, tire_size, brand, product_name, price, model, spec_width, spec_ratio, spec_inflatable_pressure, spec_tread_depth, spec_width_range, spec_sidewall, spec_tread_width, side_tread_image_url, product_link]
-                logging.debug(f"Preparing to write row: {row}")
-                writer.writerow(row)
-                logging.debug(f"Row written to CSV: {row}")
-            logging.info(f"Data from {json_file} written to CSV.")
+        rows = parse_product_rows(payload)
+        logging.debug("Prepared %d rows from %s", len(rows), source)
+        sink.write_rows(rows, token)
+        logging.info(f"Data from {source} written to CSV.")
     except Exception as e:
-        logging.error(f"Error writing to CSV file {csv_file_path}: {e}")
-
+        logging.error(f"Error writing rows for {source}: {e}")
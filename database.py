@@ -1,14 +1,44 @@
 from datetime import datetime
 from datetime import timedelta
 import os
+import atexit
+import queue
 import sqlite3
+import threading
+import time
 import logging
 
 from config import DB_PATH
 from config import CACHE_DURATION_DAYS
+from config import DB_SYNCHRONOUS
+from config import DB_WRITE_BATCH_SIZE
+from config import DB_WRITE_BATCH_INTERVAL
+from config import PAYLOAD_DICT_SIZE
+from config import PAYLOAD_DICT_SAMPLES
+from config import PAYLOAD_DICT_MIN_PAYLOADS
+from payload_codec import encode_payload
+from payload_codec import decode_payload
+from payload_codec import train_dictionary
+from payload_codec import add_dictionary
+from payload_codec import dictionaries_supported
+from utils import cache_key
 
 
 logger = logging.getLogger(__name__)
+
+_KEY_COLUMNS = {'size_data': 'size', 'product_details': 'cache_key'}
+_VALIDATOR_COLUMNS = (('etag', 'TEXT'), ('last_modified', 'TEXT'), ('content_hash', 'TEXT'))
+_PRODUCT_DETAILS_SCHEMA = '''CREATE TABLE IF NOT EXISTS {table_name} (cache_key TEXT PRIMARY KEY, url TEXT, last_fetched TIMESTAMP, data BLOB,
+                                 etag TEXT, last_modified TEXT, content_hash TEXT)'''
+# Stored as PRAGMA user_version; bumped whenever canonical_url or the key hash changes so cached product details are re-keyed
+_CACHE_KEY_VERSION = 2
+# Columns added after the first release, created on older databases by setup_database
+_ADDED_COLUMNS = {
+    'size_data': _VALIDATOR_COLUMNS + (('link_count', 'INTEGER'), ('volatility', 'REAL')),
+    'product_details': _VALIDATOR_COLUMNS,
+    'runs': (('csv_offset', 'INTEGER'),),
+}
+
 def database_file_exists():
     db_exists = os.path.exists(DB_PATH)
     logging.info(f"Database file {'exists' if db_exists else 'does not exist'} at {DB_PATH}")
@@ -18,32 +48,110 @@ def setup_database():
     try:
         with sqlite3.connect(DB_PATH) as conn:
             c = conn.cursor()
-            c.execute('''CREATE TABLE IF NOT EXISTS size_data (size TEXT PRIMARY KEY, last_fetched TIMESTAMP, data TEXT)''')
-            c.execute('''CREATE TABLE IF NOT EXISTS product_details (url TEXT PRIMARY KEY, last_fetched TIMESTAMP, data TEXT)''')
+            c.execute('''CREATE TABLE IF NOT EXISTS size_data (size TEXT PRIMARY KEY, last_fetched TIMESTAMP, data BLOB)''')
+            c.execute(_PRODUCT_DETAILS_SCHEMA.format(table_name='product_details'))
             c.execute('''CREATE TABLE IF NOT EXISTS url_segments (segment TEXT PRIMARY KEY, last_fetched TIMESTAMP)''')
+            c.execute('''CREATE TABLE IF NOT EXISTS payload_dictionaries (id INTEGER PRIMARY KEY, created TIMESTAMP, data BLOB)''')
             # Adding indexes
             c.execute('''CREATE INDEX IF NOT EXISTS idx_size_data ON size_data (last_fetched)''')
+            c.execute('''CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, started TIMESTAMP, json_directory TEXT, csv_file_path TEXT, status TEXT)''')
+            c.execute('''CREATE TABLE IF NOT EXISTS run_items (run_id TEXT, item_index INTEGER, url TEXT, state TEXT, output TEXT, updated TIMESTAMP, PRIMARY KEY (run_id, item_index))''')
+            c.execute('''CREATE TABLE IF NOT EXISTS dead_letters (kind TEXT, item_key TEXT, error_class TEXT, attempts INTEGER, detail TEXT, failed_at TIMESTAMP, PRIMARY KEY (kind, item_key))''')
+            c.execute('''CREATE TABLE IF NOT EXISTS size_failures (size TEXT PRIMARY KEY, failures INTEGER, last_failed TIMESTAMP)''')
+            c.execute('''CREATE TABLE IF NOT EXISTS size_links (size TEXT, position INTEGER, link_fragment TEXT, brand_label TEXT, product_line TEXT, PRIMARY KEY (size, position))''')
+            for table_name, added_columns in _ADDED_COLUMNS.items():
+                existing_columns = {row[1] for row in c.execute(f"PRAGMA table_info({table_name})")}
+                for column, column_type in added_columns:
+                    if column not in existing_columns:
+                        c.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {column_type}")
+            if ('cache_key' not in {row[1] for row in c.execute("PRAGMA table_info(product_details)")}
+                    or c.execute("PRAGMA user_version").fetchone()[0] < _CACHE_KEY_VERSION):
+                _migrate_product_details_to_cache_keys(c)
+                c.execute(f"PRAGMA user_version = {_CACHE_KEY_VERSION}")
             c.execute('''CREATE INDEX IF NOT EXISTS idx_product_details ON product_details (last_fetched)''')
             conn.commit()
+            c.execute("PRAGMA journal_mode=WAL")
         logging.info("Database setup completed successfully.")
     except Exception as e:
         logging.error(f"Error setting up database: {e}")
 
-def is_json_up_to_date(identifier, table_name):
+def _migrate_product_details_to_cache_keys(c):
+    """Re-key product_details by the current cache key of each row's URL, keeping the newest row of each duplicate group.
+
+    Runs as INSERT ... SELECT so payloads never pass through Python; a
+    failure rolls back with setup_database's transaction.
+    """
+    c.connection.create_function('url_cache_key', 1, cache_key, deterministic=True)
+    c.execute("DROP TABLE IF EXISTS product_details_rekeyed")  # Left behind by an interrupted migration
+    c.execute(_PRODUCT_DETAILS_SCHEMA.format(table_name='product_details_rekeyed'))
+    # Rows are read in last_fetched order, so REPLACE leaves the newest row for each key
+    c.execute('''REPLACE INTO product_details_rekeyed (cache_key, url, last_fetched, data, etag, last_modified, content_hash)
+                 SELECT url_cache_key(url), url, last_fetched, data, etag, last_modified, content_hash
+                 FROM product_details ORDER BY last_fetched''')
+    rows = c.execute("SELECT COUNT(*) FROM product_details").fetchone()[0]
+    c.execute("DROP TABLE product_details")
+    c.execute("ALTER TABLE product_details_rekeyed RENAME TO product_details")
+    merged = rows - c.execute("SELECT COUNT(*) FROM product_details").fetchone()[0]
+    logging.info(f"Re-keyed {rows} cached product details by canonical cache key, merging {merged} duplicates")
+
+def _key_for(table_name, identifier):
+    return cache_key(identifier) if table_name == 'product_details' else identifier
+
+def get_stale_identifiers(identifiers, table_name):
+    """Return the identifiers that are missing from or out of date in table_name, in input order.
+
+    Freshness for the whole batch is decided by a single range scan over the
+    last_fetched index instead of one lookup per identifier.
+    """
+    key_column = _KEY_COLUMNS.get(table_name)
+    if key_column is None:
+        logging.error("Invalid table name provided to get_stale_identifiers function.")
+        return list(identifiers)
+    cutoff = (datetime.now() - timedelta(days=CACHE_DURATION_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+    with sqlite3.connect(DB_PATH) as conn:
+        c = conn.cursor()
+        c.execute(f"SELECT {key_column} FROM {table_name} WHERE last_fetched > ?", (cutoff,))
+        fresh = {row[0] for row in c.fetchall()}
+    stale = [identifier for identifier in identifiers if _key_for(table_name, identifier) not in fresh]
+    logging.info(f"{len(stale)} of {len(identifiers)} entries in {table_name} need fetching")
+    return stale
+
+def get_cache_validators(identifiers, table_name, max_age_days=CACHE_DURATION_DAYS):
+    """Return {identifier: (etag, last_modified, content_hash)} for the given identifiers with rows older than max_age_days."""
+    key_column = _KEY_COLUMNS.get(table_name)
+    if key_column is None:
+        logging.error("Invalid table name provided to get_cache_validators function.")
+        return {}
+    cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime('%Y-%m-%d %H:%M:%S')
     with sqlite3.connect(DB_PATH) as conn:
         c = conn.cursor()
-        if table_name == 'size_data':
-            c.execute("SELECT last_fetched FROM size_data WHERE size = ?", (identifier,))
-        elif table_name == 'product_details':
-            c.execute("SELECT last_fetched FROM product_details WHERE url = ?", (identifier,))
-        else:
-            logging.error("Invalid table name provided to is_json_up_to_date function.")
-            return False
-        result = c.fetchone()
-    if result:
-        last_fetched = datetime.strptime(result[0], '%Y-%m-%d %H:%M:%S')
-        return datetime.now() - last_fetched < timedelta(days=CACHE_DURATION_DAYS)
-    return False
+        c.execute(f"SELECT {key_column}, etag, last_modified, content_hash FROM {table_name} WHERE last_fetched <= ?",
+                  (cutoff,))
+        stale_rows = {row[0]: row[1:] for row in c.fetchall()}
+    validators = {}
+    for identifier in identifiers:
+        row = stale_rows.get(_key_for(table_name, identifier))
+        if row is not None:
+            validators[identifier] = row
+    return validators
+
+def load_product_payloads(urls, chunk_size=500):
+    """Return {url: JSON text} for the cached product details of urls, reading in chunked IN queries."""
+    payloads = {}
+    urls = list(urls)
+    with sqlite3.connect(DB_PATH) as conn:
+        c = conn.cursor()
+        for start in range(0, len(urls), chunk_size):
+            chunk = {}
+            for url in urls[start:start + chunk_size]:
+                chunk.setdefault(cache_key(url), []).append(url)  # URLs of the same product share a key
+            placeholders = ', '.join('?' * len(chunk))
+            c.execute(f"SELECT cache_key, data FROM product_details WHERE cache_key IN ({placeholders})", list(chunk))
+            for key, data in c.fetchall():
+                payload = decode_payload(data)
+                for url in chunk[key]:
+                    payloads[url] = payload
+    return payloads
 
 def update_cache(filename, table_name):
     with sqlite3.connect(DB_PATH) as conn:
@@ -52,3 +160,337 @@ def update_cache(filename, table_name):
         c.execute(f"REPLACE INTO {table_name} (filename, last_fetched) VALUES (?, ?)", (filename, current_time))
         conn.commit()
 
+
+def _timestamp():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+class CacheWriter:
+    """Single writer thread that owns the only write connection to the cache database.
+
+    Callers queue statements from any thread; the writer applies them in
+    order and commits once per batch (batch_size statements or
+    batch_interval seconds, whichever comes first) in WAL mode.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_path=DB_PATH, batch_size=DB_WRITE_BATCH_SIZE,
+                 batch_interval=DB_WRITE_BATCH_INTERVAL, synchronous=DB_SYNCHRONOUS):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.synchronous = synchronous
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='cache-writer', daemon=True)
+        self._thread.start()
+
+    def execute(self, sql, params=()):
+        self._queue.put((sql, params))
+
+    def execute_many(self, statements):
+        """Queue (sql, params) statements that are always committed together."""
+        self._queue.put(list(statements))
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been committed."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        pending = 0
+        deadline = None
+        while True:
+            timeout = max(0, deadline - time.monotonic()) if pending else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is None or item is self._STOP or isinstance(item, threading.Event):
+                if pending:
+                    self._commit(conn, pending)
+                    pending = 0
+                if item is self._STOP:
+                    break
+                if item is not None:
+                    item.set()
+                continue
+
+            # Commits only happen between queue items, so a statement list never straddles two commits
+            was_pending = pending
+            for sql, params in item if isinstance(item, list) else [item]:
+                try:
+                    conn.execute(sql, params)
+                except sqlite3.Error as e:
+                    logging.error(f"Error executing queued cache write: {e}")
+                    continue
+                pending += 1
+            if pending and not was_pending:
+                deadline = time.monotonic() + self.batch_interval
+            if pending >= self.batch_size:
+                self._commit(conn, pending)
+                pending = 0
+        conn.close()
+
+    def _commit(self, conn, pending):
+        try:
+            conn.commit()
+            logging.debug(f"Committed {pending} cache writes")
+        except sqlite3.Error as e:
+            logging.error(f"Error committing cache writes: {e}")
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_cache_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = CacheWriter()
+            atexit.register(_writer.close)
+        return _writer
+
+def flush_cache_writes():
+    if _writer is not None:
+        _writer.flush()
+
+def save_size_data(size, data, etag=None, last_modified=None, content_hash=None):
+    # An upsert rather than REPLACE, so the size's refresh history (volatility) survives
+    get_cache_writer().execute(
+        '''INSERT INTO size_data (size, last_fetched, data, etag, last_modified, content_hash) VALUES (?, ?, ?, ?, ?, ?)
+           ON CONFLICT(size) DO UPDATE SET last_fetched = excluded.last_fetched, data = excluded.data, etag = excluded.etag,
+           last_modified = excluded.last_modified, content_hash = excluded.content_hash''',
+        (size, _timestamp(), encode_payload(data), etag, last_modified, content_hash))
+
+def save_product_details(url, data, etag=None, last_modified=None, content_hash=None):
+    get_cache_writer().execute(
+        "REPLACE INTO product_details (cache_key, url, last_fetched, data, etag, last_modified, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (cache_key(url), url, _timestamp(), encode_payload(data), etag, last_modified, content_hash))
+
+def save_size_links(size, product_links):
+    """Replace the product links extracted from a size page; product_links holds (fragment, brand, line) tuples.
+
+    The links and link_count are committed together, so a size never looks complete with links missing.
+    """
+    statements = [("DELETE FROM size_links WHERE size = ?", (size,))]
+    statements.extend(("INSERT INTO size_links (size, position, link_fragment, brand_label, product_line) VALUES (?, ?, ?, ?, ?)",
+                       (size, position, link_fragment, brand_label, product_line))
+                      for position, (link_fragment, brand_label, product_line) in enumerate(product_links))
+    statements.append(("UPDATE size_data SET link_count = ? WHERE size = ?", (len(product_links), size)))
+    get_cache_writer().execute_many(statements)
+
+def get_size_links():
+    """Return ({size: [(fragment, brand, line), ...]}, [sizes whose links were never extracted]) in one query."""
+    links = {}
+    missing = []
+    with sqlite3.connect(DB_PATH) as conn:
+        c = conn.cursor()
+        c.execute('''SELECT s.size, s.link_count, l.link_fragment, l.brand_label, l.product_line
+                     FROM size_data s LEFT JOIN size_links l ON l.size = s.size
+                     ORDER BY s.size, l.position''')
+        for size, link_count, link_fragment, brand_label, product_line in c.fetchall():
+            if link_count is None:
+                missing.append(size)
+                continue
+            size_links = links.setdefault(size, [])
+            if link_fragment is not None:
+                size_links.append((link_fragment, brand_label, product_line))
+    return links, missing
+
+def get_size_refresh_state():
+    """Return {size: (last_fetched, volatility)} for every cached size."""
+    with sqlite3.connect(DB_PATH) as conn:
+        return {size: (last_fetched, volatility)
+                for size, last_fetched, volatility in conn.execute("SELECT size, last_fetched, volatility FROM size_data")}
+
+def update_size_volatility(size, change, smoothing):
+    """Fold the share of top picks that changed in the latest fetch into the size's moving average."""
+    get_cache_writer().execute(
+        "UPDATE size_data SET volatility = CASE WHEN volatility IS NULL THEN ? ELSE volatility * (1 - ?) + ? * ? END WHERE size = ?",
+        (change, smoothing, smoothing, change, size))
+
+def get_size_failures():
+    """Return {size: (failures, last_failed)} for sizes whose latest refreshes failed."""
+    with sqlite3.connect(DB_PATH) as conn:
+        return {size: (failures, last_failed)
+                for size, failures, last_failed in conn.execute("SELECT size, failures, last_failed FROM size_failures")}
+
+def record_size_failure(size):
+    get_cache_writer().execute(
+        "INSERT INTO size_failures (size, failures, last_failed) VALUES (?, 1, ?) "
+        "ON CONFLICT(size) DO UPDATE SET failures = failures + 1, last_failed = excluded.last_failed",
+        (size, _timestamp()))
+
+def clear_size_failure(size):
+    get_cache_writer().execute("DELETE FROM size_failures WHERE size = ?", (size,))
+
+def touch_cache_entry(table_name, identifier, etag=None, last_modified=None):
+    """Mark an unchanged cache row as freshly fetched, keeping its payload."""
+    key_column = _KEY_COLUMNS[table_name]
+    get_cache_writer().execute(
+        f"UPDATE {table_name} SET last_fetched = ?, etag = COALESCE(?, etag), "
+        f"last_modified = COALESCE(?, last_modified) WHERE {key_column} = ?",
+        (_timestamp(), etag, last_modified, _key_for(table_name, identifier)))
+
+class RunJournal:
+    """Progress journal of one scrape run, used to resume it after a crash.
+
+    Every product URL of the run has an item with its 1-based index and a
+    state: pending, fetched (payload is in product_details), extracted
+    (rows are flushed to the run's CSV) or failed. Updates go through the
+    cache writer, so a state is never committed before the cache write it
+    depends on. Extracted marks are committed together with the CSV size
+    they were flushed at, and truncate_csv() cuts the CSV back to it.
+    """
+
+    PENDING = 'pending'
+    FETCHED = 'fetched'
+    EXTRACTED = 'extracted'
+    FAILED = 'failed'
+
+    def __init__(self, run_id, json_directory, csv_file_path, status, csv_offset=None):
+        self.run_id = run_id
+        self.json_directory = json_directory
+        self.csv_file_path = csv_file_path
+        self.status = status
+        self.csv_offset = csv_offset
+
+    @classmethod
+    def create(cls, run_id, json_directory, csv_file_path, urls):
+        writer = get_cache_writer()
+        writer.execute("INSERT INTO runs (run_id, started, json_directory, csv_file_path, status, csv_offset) VALUES (?, ?, ?, ?, ?, 0)",
+                       (run_id, _timestamp(), json_directory, csv_file_path, 'running'))
+        for index, url in enumerate(urls, 1):
+            writer.execute("INSERT INTO run_items (run_id, item_index, url, state, output, updated) VALUES (?, ?, ?, ?, NULL, ?)",
+                           (run_id, index, url, cls.PENDING, _timestamp()))
+        writer.flush()
+        logging.info(f"Started run {run_id} with {len(urls)} product URLs")
+        return cls(run_id, json_directory, csv_file_path, 'running', 0)
+
+    @classmethod
+    def load(cls, run_id):
+        flush_cache_writes()
+        with sqlite3.connect(DB_PATH) as conn:
+            row = conn.execute("SELECT json_directory, csv_file_path, status, csv_offset FROM runs WHERE run_id = ?",
+                               (run_id,)).fetchone()
+        return cls(run_id, *row) if row else None
+
+    def items(self):
+        """Return [(index, url, state)] in index order."""
+        flush_cache_writes()
+        with sqlite3.connect(DB_PATH) as conn:
+            return conn.execute("SELECT item_index, url, state FROM run_items WHERE run_id = ? ORDER BY item_index",
+                                (self.run_id,)).fetchall()
+
+    def mark(self, indices, state, output=None):
+        writer = get_cache_writer()
+        updated = _timestamp()
+        for index in indices:
+            writer.execute("UPDATE run_items SET state = ?, output = COALESCE(?, output), updated = ? WHERE run_id = ? AND item_index = ?",
+                           (state, output, updated, self.run_id, index))
+
+    def mark_extracted(self, indices, csv_offset):
+        """Mark indices extracted and record csv_offset, the CSV size once their rows were flushed, in one commit."""
+        updated = _timestamp()
+        statements = [("UPDATE run_items SET state = ?, updated = ? WHERE run_id = ? AND item_index = ?",
+                       (self.EXTRACTED, updated, self.run_id, index)) for index in indices]
+        statements.append(("UPDATE runs SET csv_offset = ? WHERE run_id = ?", (csv_offset, self.run_id)))
+        get_cache_writer().execute_many(statements)
+        self.csv_offset = csv_offset
+
+    def truncate_csv(self):
+        """Cut rows written after the last committed extracted mark from the CSV, so resuming does not repeat them."""
+        if self.csv_offset is None or not os.path.exists(self.csv_file_path):
+            return  # Runs journaled before csv_offset existed are left as they are
+        size = os.path.getsize(self.csv_file_path)
+        if size > self.csv_offset:
+            with open(self.csv_file_path, 'r+b') as file:
+                file.truncate(self.csv_offset)
+            logging.info(f"Truncated {self.csv_file_path} from {size} to {self.csv_offset} bytes")
+
+    def finish(self, status='completed'):
+        get_cache_writer().execute("UPDATE runs SET status = ? WHERE run_id = ?", (status, self.run_id))
+        flush_cache_writes()
+        self.status = status
+
+def save_dead_letter(kind, item_key, error_class, attempts, detail):
+    get_cache_writer().execute(
+        "INSERT OR REPLACE INTO dead_letters (kind, item_key, error_class, attempts, detail, failed_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (kind, item_key, error_class, attempts, detail, _timestamp()))
+
+def delete_dead_letter(kind, item_key):
+    get_cache_writer().execute("DELETE FROM dead_letters WHERE kind = ? AND item_key = ?", (kind, item_key))
+
+def get_dead_letters(kind):
+    """Return the keys of items of this kind that a retry budget gave up on, oldest first."""
+    flush_cache_writes()
+    with sqlite3.connect(DB_PATH) as conn:
+        return [row[0] for row in conn.execute("SELECT item_key FROM dead_letters WHERE kind = ? ORDER BY failed_at",
+                                               (kind,))]
+
+def save_url_segment(segment):
+    get_cache_writer().execute("INSERT OR REPLACE INTO url_segments (segment, last_fetched) VALUES (?, ?)",
+                               (segment, _timestamp()))
+
+def train_payload_dictionary():
+    """Train a zstd dictionary from a sample of cached payloads, store it and compress new payloads with it."""
+    flush_cache_writes()
+    with sqlite3.connect(DB_PATH) as conn:
+        samples = []
+        for table_name in _KEY_COLUMNS:
+            rows = conn.execute(f"SELECT data FROM {table_name} ORDER BY RANDOM() LIMIT ?", (PAYLOAD_DICT_SAMPLES // 2,))
+            samples.extend(decode_payload(row[0]).encode('utf-8') for row in rows.fetchall() if row[0] is not None)
+        try:
+            dictionary = train_dictionary(samples, PAYLOAD_DICT_SIZE)
+        except Exception as e:
+            logging.error(f"Error training payload compression dictionary: {e}")
+            return
+        if not dictionary:
+            return
+        dict_id = conn.execute("INSERT INTO payload_dictionaries (created, data) VALUES (?, ?)",
+                               (_timestamp(), dictionary)).lastrowid
+        conn.commit()
+    add_dictionary(dict_id, dictionary)
+    logging.info(f"Trained a {len(dictionary)} byte compression dictionary from {len(samples)} payloads")
+
+def ensure_payload_dictionary():
+    """Train the first zstd dictionary once PAYLOAD_DICT_MIN_PAYLOADS payloads are cached."""
+    if not dictionaries_supported():
+        return
+    with sqlite3.connect(DB_PATH) as conn:
+        if conn.execute("SELECT 1 FROM payload_dictionaries LIMIT 1").fetchone():
+            return
+        cached = sum(conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0] for table_name in _KEY_COLUMNS)
+    if cached >= PAYLOAD_DICT_MIN_PAYLOADS:
+        train_payload_dictionary()
+
+def compress_cached_payloads(chunk_size=500):
+    """One-time migration: train a zstd dictionary and rewrite TEXT payload rows as compressed BLOBs."""
+    setup_database()
+    train_payload_dictionary()
+    with sqlite3.connect(DB_PATH) as conn:
+        c = conn.cursor()
+        for table_name, key_column in _KEY_COLUMNS.items():
+            converted = 0
+            while True:
+                c.execute(f"SELECT {key_column}, data FROM {table_name} WHERE typeof(data) = 'text' LIMIT ?", (chunk_size,))
+                rows = c.fetchall()
+                if not rows:
+                    break
+                c.executemany(f"UPDATE {table_name} SET data = ? WHERE {key_column} = ?",
+                              [(encode_payload(data), key) for key, data in rows])
+                conn.commit()
+                converted += len(rows)
+            logging.info(f"Compressed {converted} payloads in {table_name}")
+    with sqlite3.connect(DB_PATH) as conn:
+        conn.execute("VACUUM")
+    logging.info("Payload compression migration completed.")
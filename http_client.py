@@ -0,0 +1,108 @@
+import threading
+import logging
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from requests import RequestException
+
+from config import HTTP_POOL_CONNECTIONS
+from config import HTTP_POOL_MAXSIZE
+from config import KEEPALIVE_TIMEOUT
+from config import REQUEST_TIMEOUT
+from rate_controller import controller
+from rate_controller import parse_retry_after
+
+try:
+    import brotli  # noqa: F401  (enables br decoding in urllib3 and aiohttp)
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    'Accept': 'application/json',
+    'Accept-Encoding': ACCEPT_ENCODING,
+    'Connection': 'keep-alive',
+}
+
+# One adapter (and so one urllib3 pool manager) is mounted on every thread's
+# session, so keep-alive connections are shared between worker threads.
+_adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=True)
+_local = threading.local()
+_async_stats = {'handshakes': 0, 'pool_hits': 0}
+
+def get_session():
+    """Return the calling thread's session, creating it on first use."""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.headers.update(DEFAULT_HEADERS)
+        session.mount('https://', _adapter)
+        session.mount('http://', _adapter)
+        _local.session = session
+    return session
+
+def conditional_headers(validators):
+    """Build If-None-Match/If-Modified-Since headers from a cache row's (etag, last_modified, content_hash)."""
+    headers = {}
+    if validators:
+        etag, last_modified = validators[0], validators[1]
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+    return headers
+
+def get(url, **kwargs):
+    """GET through the calling thread's session, paced by the shared rate controller."""
+    kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+    ticket = controller.acquire()
+    status, retry_after = None, None
+    try:
+        response = get_session().get(url, **kwargs)
+        status, retry_after = response.status_code, parse_retry_after(response.headers.get('Retry-After'))
+    finally:
+        controller.release(ticket, status, retry_after)  # Whatever was raised, so the slot is never leaked
+    return response
+
+def create_async_session(concurrency):
+    """Create an aiohttp session with the same headers and pool accounting as the sync client."""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_end.append(_on_async_connection_create)
+    trace_config.on_connection_reuseconn.append(_on_async_connection_reuse)
+    connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=KEEPALIVE_TIMEOUT)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers=DEFAULT_HEADERS,
+                                 trace_configs=[trace_config])
+
+async def _on_async_connection_create(session, context, params):
+    _async_stats['handshakes'] += 1
+
+async def _on_async_connection_reuse(session, context, params):
+    _async_stats['pool_hits'] += 1
+
+def get_metrics():
+    """Return handshake and pool-hit counts for the sync and async clients, and the rate controller's state."""
+    handshakes = 0
+    total_requests = 0
+    pools = _adapter.poolmanager.pools
+    for key in list(pools.keys()):
+        pool = pools.get(key)
+        if pool is not None:
+            handshakes += pool.num_connections
+            total_requests += pool.num_requests
+    return {
+        'sync_handshakes': handshakes,
+        'sync_requests': total_requests,
+        'sync_pool_hits': total_requests - handshakes,
+        'async_handshakes': _async_stats['handshakes'],
+        'async_pool_hits': _async_stats['pool_hits'],
+        **controller.metrics(),
+    }
+
+def log_metrics():
+    metrics = get_metrics()
+    logging.info("HTTP connection metrics: " + ", ".join(f"{name}={value}" for name, value in metrics.items()))
@@ -0,0 +1,160 @@
+from typing import Any
+from typing import List
+from typing import TypedDict
+import json
+import logging
+
+from config import JSON_BACKEND
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+logger = logging.getLogger(__name__)
+
+def _select_backend(preferred):
+    available = {'orjson': orjson is not None, 'msgspec': msgspec is not None, 'json': True}
+    if preferred != 'auto':
+        if available.get(preferred):
+            return preferred
+        logging.warning(f"JSON backend {preferred!r} is not available, choosing automatically")
+    for name in ('orjson', 'msgspec', 'json'):
+        if available[name]:
+            return name
+
+BACKEND = _select_backend(JSON_BACKEND)
+
+if BACKEND == 'orjson':
+    _loads = orjson.loads
+
+    def _dumps(obj):
+        return orjson.dumps(obj).decode('utf-8')
+elif BACKEND == 'msgspec':
+    _loads = msgspec.json.decode
+
+    def _dumps(obj):
+        return msgspec.json.encode(obj).decode('utf-8')
+else:
+    _loads = json.loads
+    _dumps = json.dumps
+
+def loads(data):
+    """Decode JSON from str or bytes."""
+    return _loads(data)
+
+def dumps(obj):
+    """Encode obj as a JSON str."""
+    return _dumps(obj)
+
+def load(file):
+    return _loads(file.read())
+
+def dump(obj, file):
+    file.write(_dumps(obj))
+
+# Only the fields the scraper reads. With msgspec installed, payloads are
+# decoded straight into these shapes and every other field is skipped;
+# the results are still plain dicts, so callers use them like loads().
+
+class _Label(TypedDict, total=False):
+    label: Any
+
+class _Link(TypedDict, total=False):
+    href: Any
+
+class _TopPickProduct(TypedDict, total=False):
+    link: _Link
+    brand: _Label
+
+class _TopPick(TypedDict, total=False):
+    product: _TopPickProduct
+
+class _CatalogSummary(TypedDict, total=False):
+    siteCatalogSummaryTopPicksList: List[_TopPick]
+
+class _ServerData(TypedDict, total=False):
+    siteCatalogSummary: _CatalogSummary
+
+class _PageProps(TypedDict, total=False):
+    serverData: _ServerData
+
+class SizePage(TypedDict, total=False):
+    pageProps: _PageProps
+
+class _Spec(TypedDict, total=False):
+    label: Any
+    value: Any
+
+class _Image(TypedDict, total=False):
+    src: Any
+
+class _Asset(TypedDict, total=False):
+    productImageType: Any
+    image: _Image
+
+class _AvailableSize(TypedDict, total=False):
+    size: Any
+    partNumber: Any
+    priceInCents: Any
+    specList: List[_Spec]
+    siteQueryParams: dict
+
+class _ProductLine(TypedDict, total=False):
+    name: Any
+    brand: _Label
+    assetList: List[_Asset]
+
+class ProductDetail(TypedDict, total=False):
+    siteProductLine: _ProductLine
+    siteProductLineAvailableSizeList: List[_AvailableSize]
+
+_typed_decoders = {}
+_TOP_PICKS_KEY = '"siteCatalogSummaryTopPicksList"'
+_raw_decoder = json.JSONDecoder()
+
+def _decode_top_picks_only(data):
+    """Decode just the top-picks array of a size page, without building the rest of the tree."""
+    text = data.decode('utf-8') if isinstance(data, (bytes, bytearray)) else data
+    start = text.find(_TOP_PICKS_KEY)
+    if start == -1:
+        return {}
+    if text.find(_TOP_PICKS_KEY, start + 1) != -1:
+        return loads(data)  # Key is not unique, let the full decode pick the right one
+    colon = text.index(':', start + len(_TOP_PICKS_KEY))
+    value_start = colon + 1
+    while text[value_start] in ' \t\r\n':
+        value_start += 1
+    top_picks, _ = _raw_decoder.raw_decode(text, value_start)
+    return {'pageProps': {'serverData': {'siteCatalogSummary': {'siteCatalogSummaryTopPicksList': top_picks}}}}
+
+def _decode_typed(data, payload_type):
+    if msgspec is None:
+        return loads(data)
+    decoder = _typed_decoders.get(payload_type)
+    if decoder is None:
+        decoder = _typed_decoders[payload_type] = msgspec.json.Decoder(payload_type)
+    try:
+        return decoder.decode(data)
+    except msgspec.ValidationError:
+        return loads(data)  # Unexpected shape, e.g. a null list; keep the full payload
+
+def decode_size_page(data):
+    """Decode only the top-picks part of a tire-size page.
+
+    Uses msgspec typed decoding when installed, otherwise decodes just the
+    siteCatalogSummaryTopPicksList array out of the raw text.
+    """
+    if msgspec is not None:
+        return _decode_typed(data, SizePage)
+    return _decode_top_picks_only(data)
+
+def decode_product_detail(data):
+    """Decode a product-detail payload, keeping only the fields used for CSV rows when msgspec is available."""
+    return _decode_typed(data, ProductDetail)
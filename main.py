@@ -1,6 +1,5 @@
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
-from concurrent.futures import as_completed
+import argparse
 import os
 import threading
 import logging
@@ -8,54 +7,182 @@ import logging
 from config import DATA_DIR
 from config import DB_PATH
 from config import LOG_FILE
+from config import CSV_CONSUMERS
+from config import EXTRACT_PROCESSES
+from config import COLUMNAR_EXPORT
 from database import database_file_exists
 from database import setup_database
-from scraper import setup_driver
+from database import get_stale_identifiers
+from database import get_dead_letters
+from database import delete_dead_letter
+from database import flush_cache_writes
+from database import compress_cached_payloads
+from database import ensure_payload_dictionary
+from database import RunJournal
+from scraper import create_pooled_driver
+from browser_pool import BrowserPool
+from segment_discovery import SegmentManager
 from scraper import get_or_update_url_segment
+from scraper import rediscover_url_segment
 from scraper import fetch_and_save_size_data
 from scraper import scrape_and_save_json
-from scraper import fetch_and_save_product_details
-from scraper import prepare_product_details_api_request_urls
+from scraper import fetch_product_details_over_http
+from scraper import prepare_product_requests
 from scraper import process_downloaded_files
+from scraper import process_downloaded_files_in_pool
+from scraper import create_download_queue
+from csv_handler import CsvSink
+from csv_handler import SinkGroup
+from columnar_export import ColumnarSink
 from utils import ensure_dir
+from utils import cache_key
+import http_client
 import logger_config
 
 
 logger_config.setup_logging(LOG_FILE)
 
-def main():
-    if not database_file_exists():
-        setup_database()
+def main(resume_run_id=None):
+    database_file_exists()
+    setup_database()  # Creates missing tables and upgrades older cache databases
 
     ensure_dir(DATA_DIR)
 
-    driver = setup_driver()
-    dynamic_url_segment = get_or_update_url_segment(driver)
-    driver.quit()
+    # The segment-discovery browser stays warm and is reused by the scrape phase
+    with BrowserPool(create_pooled_driver) as browser_pool:
+        if resume_run_id:
+            journal = RunJournal.load(resume_run_id)
+            if journal is None:
+                logging.error(f"No run with id {resume_run_id} to resume.")
+                return
+            journal.truncate_csv()
+            indexed_links = [(index, url) for index, url, state in journal.items() if state != RunJournal.EXTRACTED]
+            segment_manager = SegmentManager(rediscover_url_segment)  # Only resolved if a _next/data link needs it
+            logging.info(f"Resuming run {resume_run_id}: {len(indexed_links)} product URLs left")
+        else:
+            dynamic_url_segment = get_or_update_url_segment(browser_pool)
+            if not dynamic_url_segment:
+                logging.error("Failed to extract dynamic URL segment.")
+                return
 
-    if dynamic_url_segment:
-        fetch_and_save_size_data(driver, dynamic_url_segment)
+            segment_manager = SegmentManager(rediscover_url_segment, dynamic_url_segment)
+            fetch_and_save_size_data(segment_manager)
 
-        current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        json_directory = os.path.join(DATA_DIR, f"product_details_{current_datetime}")
-        csv_file_path = f"product_data_{current_datetime}.csv"
-        downloaded_files = []
-        scraping_completed_flag = [False]
+            current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            json_directory = os.path.join(DATA_DIR, f"product_details_{current_datetime}")
+            csv_file_path = f"product_data_{current_datetime}.csv"
 
-        product_details = prepare_product_details_api_request_urls()
+            product_details = prepare_product_requests()
+            journal = RunJournal.create(current_datetime, json_directory, csv_file_path, product_details)
+            indexed_links = list(enumerate(product_details, 1))
 
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = [executor.submit(fetch_and_save_product_details, url, json_directory) for url in product_details]
-            for future in as_completed(futures):
-                future.result()  # Blocks until the future is done
-
-        threading.Thread(target=scrape_and_save_json, args=(product_details, json_directory, downloaded_files, scraping_completed_flag)).start()
-        threading.Thread(target=process_downloaded_files, args=(downloaded_files, csv_file_path, scraping_completed_flag)).start()
-    else:
-        logging.error("Failed to extract dynamic URL segment.")
+        ensure_payload_dictionary()  # Size pages alone may be enough to train it before the product details
+        run_product_details(journal, indexed_links, browser_pool, segment_manager)
+        ensure_payload_dictionary()
+        http_client.log_metrics()
 
     logging.info("Main thread completed.")
 
+def run_product_details(journal, indexed_links, browser_pool, segment_manager):
+    """Fetch the run's product details and write their rows, recording progress in the journal."""
+    downloaded_files = create_download_queue()
+    product_details = [url for _, url in indexed_links]
+    stale_product_details = get_stale_identifiers(product_details, 'product_details')
+    stale_set = set(stale_product_details)
+    indices = {url: index for index, url in indexed_links}
+    for index, url in indexed_links:
+        if url not in stale_set:
+            journal.mark([index], RunJournal.FETCHED, cache_key(url))
+
+    fetch_product_details_over_http(stale_product_details, journal.json_directory,
+                                    on_fetched=lambda url: journal.mark([indices[url]], RunJournal.FETCHED, cache_key(url)))
+
+    sinks = [CsvSink(journal.csv_file_path, on_flush=journal.mark_extracted)]
+    if COLUMNAR_EXPORT:
+        # An interrupted export has no footer and cannot be read, so a resumed run writes a new file
+        # that starts with the rows the CSV already holds
+        export_stamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        try:
+            columnar_sink = ColumnarSink(f"product_data_{export_stamp}.{COLUMNAR_EXPORT}", COLUMNAR_EXPORT)
+        except (RuntimeError, ValueError) as e:
+            logging.error(f"Columnar export disabled: {e}")
+        else:
+            columnar_sink.write_csv_rows(journal.csv_file_path)
+            sinks.append(columnar_sink)
+
+    with SinkGroup(sinks) as output_sink:
+        if EXTRACT_PROCESSES:
+            consumers = [threading.Thread(target=process_downloaded_files_in_pool,
+                                          args=(downloaded_files, output_sink, EXTRACT_PROCESSES,
+                                                [index for index, _ in indexed_links]))]
+        else:
+            consumers = [threading.Thread(target=process_downloaded_files, args=(downloaded_files, output_sink))
+                         for _ in range(CSV_CONSUMERS)]
+        threads = [threading.Thread(target=scrape_and_save_json,
+                                    args=(indexed_links, journal.json_directory, downloaded_files, len(consumers),
+                                          browser_pool, True, journal, segment_manager))]
+        threads.extend(consumers)
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    remaining = sum(1 for _, _, state in journal.items() if state != RunJournal.EXTRACTED)
+    journal.finish('completed' if not remaining else 'incomplete')
+    if remaining:
+        logging.warning(f"{remaining} product URLs were not written; rerun with --resume {journal.run_id}")
+
+def retry_dead_letters():
+    """Give sizes and product URLs that ran out of retries in earlier runs a fresh retry budget.
+
+    Product URLs go through the same HTTP, browser and CSV stages as a
+    regular run, as a run of their own that --resume can finish.
+    """
+    database_file_exists()
+    setup_database()
+    ensure_dir(DATA_DIR)
+
+    sizes = get_dead_letters('size_data')
+    product_urls = get_dead_letters('product_details')
+    logging.info(f"Retrying {len(sizes)} sizes and {len(product_urls)} product URLs from the dead-letter list")
+    with BrowserPool(create_pooled_driver) as browser_pool:
+        segment_manager = SegmentManager(rediscover_url_segment)  # Only resolved if a _next/data link needs it
+        if sizes:
+            dynamic_url_segment = get_or_update_url_segment(browser_pool)
+            if dynamic_url_segment:
+                segment_manager = SegmentManager(rediscover_url_segment, dynamic_url_segment)
+                fetch_and_save_size_data(segment_manager, sizes)
+            else:
+                logging.error("Failed to extract dynamic URL segment.")
+        if product_urls:
+            current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            journal = RunJournal.create(f"{current_datetime}_dead_letters",
+                                        os.path.join(DATA_DIR, f"product_details_{current_datetime}_dead_letters"),
+                                        f"product_data_{current_datetime}_dead_letters.csv", product_urls)
+            run_product_details(journal, list(enumerate(product_urls, 1)), browser_pool, segment_manager)
+            for _, url, state in journal.items():
+                if state == RunJournal.EXTRACTED:
+                    delete_dead_letter('product_details', url)  # Also covers URLs another run has since cached
+    flush_cache_writes()
+    remaining = len(get_dead_letters('size_data')) + len(get_dead_letters('product_details'))
+    logging.info(f"{remaining} items are still dead-lettered")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrape tire sizes and product details from simpletire.com.")
+    parser.add_argument('--compress-cache', action='store_true',
+                        help="Compress existing TEXT payloads in the cache database and exit.")
+    parser.add_argument('--resume', metavar='RUN_ID',
+                        help="Finish an interrupted run, skipping product URLs whose rows are already written.")
+    parser.add_argument('--retry-dead-letters', action='store_true',
+                        help="Retry sizes and product URLs that ran out of retries in earlier runs and exit.")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.compress_cache:
+        compress_cached_payloads()
+    elif args.retry_dead_letters:
+        retry_dead_letters()
+    else:
+        main(args.resume)
 
@@ -0,0 +1,102 @@
+import sqlite3
+import threading
+import zlib
+import logging
+
+from config import DB_PATH
+from config import PAYLOAD_COMPRESSION_LEVEL
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+# Compressed payloads are BLOBs whose first byte names the codec. Legacy
+# rows are plain TEXT and are returned unchanged by decode_payload.
+ZLIB_TAG = b'z'
+ZSTD_TAG = b's'
+ZSTD_DICT_TAG = b'd'
+
+_local = threading.local()
+_dicts = {}
+_dicts_lock = threading.Lock()
+_active_dict_id = None
+_dicts_loaded = False
+
+def _load_dictionaries():
+    global _active_dict_id, _dicts_loaded
+    with _dicts_lock:
+        if _dicts_loaded:
+            return
+        try:
+            with sqlite3.connect(DB_PATH) as conn:
+                rows = conn.execute("SELECT id, data FROM payload_dictionaries ORDER BY id").fetchall()
+        except sqlite3.Error:
+            rows = []
+        for dict_id, data in rows:
+            _dicts[dict_id] = zstandard.ZstdCompressionDict(data)
+            _active_dict_id = dict_id
+        _dicts_loaded = True
+
+def add_dictionary(dict_id, data):
+    """Use a newly stored dictionary for every payload encoded from now on."""
+    global _active_dict_id
+    _load_dictionaries()
+    with _dicts_lock:
+        _dicts[dict_id] = zstandard.ZstdCompressionDict(data)
+        _active_dict_id = dict_id
+
+def _compressor(dict_id):
+    compressors = _local.__dict__.setdefault('compressors', {})
+    if dict_id not in compressors:
+        dict_data = _dicts[dict_id] if dict_id is not None else None
+        compressors[dict_id] = zstandard.ZstdCompressor(level=PAYLOAD_COMPRESSION_LEVEL, dict_data=dict_data)
+    return compressors[dict_id]
+
+def _decompressor(dict_id):
+    decompressors = _local.__dict__.setdefault('decompressors', {})
+    if dict_id not in decompressors:
+        dict_data = _dicts[dict_id] if dict_id is not None else None
+        decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+    return decompressors[dict_id]
+
+def encode_payload(text):
+    """Compress a JSON text payload into a tagged BLOB for storage."""
+    raw = text.encode('utf-8')
+    if zstandard is None:
+        return ZLIB_TAG + zlib.compress(raw, min(PAYLOAD_COMPRESSION_LEVEL, 9))
+    _load_dictionaries()
+    dict_id = _active_dict_id
+    if dict_id is None:
+        return ZSTD_TAG + _compressor(None).compress(raw)
+    return ZSTD_DICT_TAG + dict_id.to_bytes(4, 'big') + _compressor(dict_id).compress(raw)
+
+def decode_payload(value):
+    """Return the JSON text stored in a cache row, whether it is legacy TEXT or a compressed BLOB."""
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    tag, body = value[:1], value[1:]
+    if tag == ZLIB_TAG:
+        return zlib.decompress(body).decode('utf-8')
+    if zstandard is None:
+        raise ValueError("Payload is zstd compressed but the zstandard package is not installed")
+    if tag == ZSTD_TAG:
+        return _decompressor(None).decompress(body).decode('utf-8')
+    if tag == ZSTD_DICT_TAG:
+        _load_dictionaries()
+        dict_id = int.from_bytes(body[:4], 'big')
+        return _decompressor(dict_id).decompress(body[4:]).decode('utf-8')
+    raise ValueError(f"Unknown payload encoding tag {tag!r}")
+
+def dictionaries_supported():
+    return zstandard is not None
+
+def train_dictionary(samples, dict_size):
+    """Train a zstd dictionary from raw payload samples, or return None if zstd is unavailable."""
+    if zstandard is None or not samples:
+        return None
+    return zstandard.train_dictionary(dict_size, samples).as_bytes()
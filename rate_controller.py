@@ -0,0 +1,167 @@
+from collections import deque
+from datetime import datetime
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+import time
+import asyncio
+import threading
+import logging
+
+from config import RATE_INITIAL
+from config import RATE_MIN
+from config import RATE_MAX
+from config import RATE_CONCURRENCY_INITIAL
+from config import RATE_CONCURRENCY_MAX
+from config import RATE_LATENCY_P95_TARGET
+from config import RATE_ERROR_RATE_TARGET
+from config import RATE_WINDOW
+
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_STATUSES = (429, 503)
+
+def parse_retry_after(value):
+    """Return the seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+class AdaptiveRateController:
+    """AIMD pacing of requests to the site, shared by every fetch path.
+
+    A token bucket spaces request starts at `rate` per second, and at most
+    `concurrency` requests are in flight. Every `window` responses both
+    grow by a step while p95 latency and the error rate stay on target, and
+    shrink by DECREASE otherwise. A 429, 503 or Retry-After halves them at
+    once and pauses new requests until the server's delay has passed.
+    """
+
+    RATE_STEP = 1.0  # requests per second added after a healthy window
+    DECREASE = 0.7
+    POLL_INTERVAL = 0.01  # seconds between checks for a free concurrency slot
+
+    def __init__(self, rate=RATE_INITIAL, min_rate=RATE_MIN, max_rate=RATE_MAX,
+                 concurrency=RATE_CONCURRENCY_INITIAL, max_concurrency=RATE_CONCURRENCY_MAX,
+                 latency_target=RATE_LATENCY_P95_TARGET, error_rate_target=RATE_ERROR_RATE_TARGET, window=RATE_WINDOW):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.error_rate_target = error_rate_target
+        self.window = window
+        self.p95_latency = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._latencies = deque()
+        self._errors = 0
+
+    def acquire(self, cost=1):
+        """Wait for a request slot and return the ticket to pass to release(); cost counts batched requests."""
+        while True:
+            delay = self._try_acquire(cost)
+            if not delay:
+                return time.monotonic()
+            time.sleep(delay)
+
+    async def acquire_async(self, cost=1):
+        while True:
+            delay = self._try_acquire(cost)
+            if not delay:
+                return time.monotonic()
+            await asyncio.sleep(delay)
+
+    def release(self, ticket, status, retry_after=None, cost=1, latency_target=None):
+        """Free the slot of ticket and record the outcome; status is None when the request failed outright.
+
+        A ticket acquired with cost > 1 records its latency per request.
+        Paths that are slow by nature, like page navigations, pass their own
+        latency_target; their latency is scaled to the controller's target
+        so every path shares one p95.
+        """
+        latency = (time.monotonic() - ticket) / cost
+        if latency_target:
+            latency *= self.latency_target / latency_target
+        with self._lock:
+            self._in_flight -= 1
+            if status in THROTTLE_STATUSES or (retry_after is not None and (status is None or status >= 400)):
+                self._back_off(status, retry_after)
+                return
+            self._latencies.append(latency)
+            if status is None or status >= 500:
+                self._errors += 1
+            if len(self._latencies) >= self.window:
+                self._adjust()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'rate': round(self.rate, 2),
+                'concurrency_limit': self.concurrency,
+                'p95_latency': round(self.p95_latency, 3),
+                'throttled_responses': self.throttled,
+            }
+
+    def _try_acquire(self, cost):
+        """Take a slot and cost tokens, or return how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._tokens = min(1.0, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            if self._in_flight >= self.concurrency:
+                return self.POLL_INTERVAL
+            if self._tokens < 1.0:
+                return (1.0 - self._tokens) / self.rate
+            self._tokens -= cost  # A batch may overdraw; later requests wait until it is paid back
+            self._in_flight += 1
+            return 0
+
+    def _back_off(self, status, retry_after):
+        self.throttled += 1
+        now = time.monotonic()
+        if now >= self._paused_until:  # Back off once per throttling episode, not once per in-flight request
+            self.rate = max(self.min_rate, self.rate * 0.5)
+            self.concurrency = max(1, self.concurrency // 2)
+            logging.warning(f"Throttled by the server ({status}, Retry-After {retry_after}); "
+                            f"rate {self.rate:.2f} req/s, concurrency {self.concurrency}")
+        pause = retry_after if retry_after is not None else 1.0 / self.rate
+        self._paused_until = max(self._paused_until, now + pause)
+        self._latencies.clear()
+        self._errors = 0
+
+    def _adjust(self):
+        latencies = sorted(self._latencies)
+        self.p95_latency = latencies[int(0.95 * (len(latencies) - 1))]
+        error_rate = self._errors / len(latencies)
+        if self.p95_latency > self.latency_target or error_rate > self.error_rate_target:
+            self.rate = max(self.min_rate, self.rate * self.DECREASE)
+            self.concurrency = max(1, int(self.concurrency * self.DECREASE))
+            logging.info(f"p95 latency {self.p95_latency:.2f}s, error rate {error_rate:.0%}: "
+                         f"slowing to {self.rate:.2f} req/s, concurrency {self.concurrency}")
+        else:
+            self.rate = min(self.max_rate, self.rate + self.RATE_STEP)
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            logging.debug(f"Speeding up to {self.rate:.2f} req/s, concurrency {self.concurrency}")
+        self._latencies.clear()
+        self._errors = 0
+
+# The one controller all fetch paths share
+controller = AdaptiveRateController()
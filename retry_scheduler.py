@@ -0,0 +1,184 @@
+from collections import Counter
+from functools import partial
+import heapq
+import itertools
+import random
+import threading
+import time
+import logging
+
+from config import RETRY_BUDGETS
+from config import RETRY_BASE_DELAY
+from config import RETRY_MAX_DELAY
+from database import get_dead_letters
+from database import save_dead_letter
+from database import delete_dead_letter
+from rate_controller import THROTTLE_STATUSES
+
+
+logger = logging.getLogger(__name__)
+
+class RetryableError(Exception):
+    """Raised by a task to have RetryScheduler run it again later."""
+
+    def __init__(self, error_class, retry_after=None, detail=None):
+        super().__init__(detail or error_class)
+        self.error_class = error_class
+        self.retry_after = retry_after
+        self.detail = detail or error_class
+
+def classify_status(status):
+    """Return the retry error class of an HTTP status (None for a failed request), or None if retrying won't help."""
+    if status is None:
+        return 'network'
+    if status in THROTTLE_STATUSES:
+        return 'throttled'
+    if status >= 500:
+        return 'server'
+    return None
+
+class RetryPolicy:
+    """Per-error-class retry budgets and backoff for one kind of item, with a persisted dead-letter list.
+
+    Budgets count retries after the first attempt. Delays grow
+    exponentially from base_delay up to max_delay with equal jitter, and
+    never undercut a server's Retry-After.
+    """
+
+    def __init__(self, kind, budgets=RETRY_BUDGETS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        self.kind = kind
+        self.budgets = budgets
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.dead_lettered = 0
+        self._known_dead = set(get_dead_letters(kind))
+
+    def delay(self, error_class, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt, or None once the class budget is spent."""
+        if attempt > self.budgets.get(error_class, 0):
+            return None
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = cap / 2 + random.uniform(0, cap / 2)
+        return max(delay, retry_after or 0)
+
+    def give_up(self, key, error_class, attempts, detail):
+        logging.error(f"Giving up on {self.kind} {key} after {attempts} {error_class} retries: {detail}")
+        save_dead_letter(self.kind, str(key), error_class, attempts, detail)
+        self.dead_lettered += 1
+
+    def settled(self, key):
+        """Drop key from the dead-letter list once it succeeds or fails for a reason retrying can't fix."""
+        if str(key) in self._known_dead:
+            delete_dead_letter(self.kind, str(key))
+            self._known_dead.discard(str(key))
+
+class _Task:
+    def __init__(self, key, fn, args, on_done):
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.on_done = on_done
+        self.attempts = Counter()
+
+class RetryScheduler:
+    """Runs tasks on a worker pool and retries them from a delay queue.
+
+    submit_to_pool is an executor-style submit, e.g. ThreadPoolExecutor.submit
+    or BrowserPool.submit (whose workers pass their driver as the first
+    argument to the task). A task that raises RetryableError goes back on
+    the delay queue; a timer thread resubmits it when its backoff expires,
+    so no worker waits on it meanwhile. on_done(key, result) runs once per
+    task with its return value, or None if it failed for good.
+    """
+
+    def __init__(self, policy, submit_to_pool):
+        self.policy = policy
+        self._submit_to_pool = submit_to_pool
+        self._cond = threading.Condition()
+        self._delayed = []
+        self._sequence = itertools.count()
+        self._outstanding = 0
+        self._closed = False
+        self._timer = threading.Thread(target=self._release_due, name=f'retry-{policy.kind}', daemon=True)
+        self._timer.start()
+
+    def submit(self, key, fn, *args, on_done=None):
+        with self._cond:
+            self._outstanding += 1
+        self._dispatch(_Task(key, fn, args, on_done))
+
+    def join(self):
+        """Wait until every submitted task has succeeded or failed for good, retries included."""
+        with self._cond:
+            while self._outstanding:
+                self._cond.wait()
+
+    def close(self):
+        self.join()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._timer.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _dispatch(self, task):
+        future = self._submit_to_pool(partial(self._attempt, task))
+        future.add_done_callback(partial(self._check_dispatch, task))
+
+    def _check_dispatch(self, task, future):
+        # _attempt handles its own errors, so this only sees workers that failed before running it
+        if future.cancelled():
+            self._finish(task, None)
+        elif future.exception() is not None:
+            self._retry(task, RetryableError('worker', detail=str(future.exception())))
+
+    def _attempt(self, task, *worker_args):
+        try:
+            result = task.fn(*worker_args, *task.args)
+        except RetryableError as e:
+            self._retry(task, e)
+            return
+        except Exception as e:
+            logging.error(f"Unexpected error for {self.policy.kind} {task.key}: {e}")
+            result = None
+        else:
+            self.policy.settled(task.key)
+        self._finish(task, result)
+
+    def _retry(self, task, error):
+        task.attempts[error.error_class] += 1
+        attempt = task.attempts[error.error_class]
+        delay = self.policy.delay(error.error_class, attempt, error.retry_after)
+        if delay is None:
+            self.policy.give_up(task.key, error.error_class, attempt - 1, error.detail)
+            self._finish(task, None)
+            return
+        logging.warning(f"Retrying {self.policy.kind} {task.key} in {delay:.1f}s "
+                        f"after {error.error_class} error ({error.detail}), retry {attempt}")
+        with self._cond:
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), task))
+            self._cond.notify_all()
+
+    def _finish(self, task, result):
+        try:
+            if task.on_done is not None:
+                task.on_done(task.key, result)
+        finally:
+            with self._cond:
+                self._outstanding -= 1
+                self._cond.notify_all()
+
+    def _release_due(self):
+        while True:
+            with self._cond:
+                while not self._closed and (not self._delayed or self._delayed[0][0] > time.monotonic()):
+                    self._cond.wait(self._delayed[0][0] - time.monotonic() if self._delayed else None)
+                if self._closed:
+                    return
+                _, _, task = heapq.heappop(self._delayed)
+            self._dispatch(task)
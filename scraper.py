@@ -1,31 +1,79 @@
 from datetime import datetime
 from datetime import timedelta
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import os
 import re
-import requests
-import json
+import queue
 import time
 import sqlite3
 import logging
 
 from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 from selenium.common.exceptions import TimeoutException
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import WebDriverException
 import undetected_chromedriver as uc
 
 from config import DB_PATH
 from config import DATA_DIR
-from config import RATE_LIMIT
-from config import SCRAPE_ATTEMPTS
+from config import SEGMENT_MAX_REFRESHES
+from config import RATE_CONCURRENCY_MAX
+from config import RATE_BROWSER_LATENCY_P95_TARGET
+from config import SIZE_REFRESH_TIME_BUDGET
+from config import SIZE_REFRESH_CHUNK
+from config import SIZE_PAGE_WORKERS
 from config import SIZES
-from database import is_json_up_to_date
-from csv_handler import extract_product_details_data_and_write_to_csv
+from config import DOWNLOAD_QUEUE_SIZE
+from config import SAVE_RAW_JSON
+from config import EXTRACT_BACKLOG_PER_PROCESS
+from config import BROWSER_FETCH_MODE
+from config import BROWSER_FETCH_BATCH_SIZE
+from config import BROWSER_FETCH_SCRIPT_TIMEOUT
+from database import get_stale_identifiers
+from database import get_cache_validators
+from database import touch_cache_entry
+from database import save_size_data
+from database import save_product_details
+from database import save_url_segment
+from database import flush_cache_writes
+from database import save_size_links
+from database import get_size_links
+from database import load_product_payloads
+from database import record_size_failure
+from database import clear_size_failure
+from payload_codec import decode_payload
+import http_client
+from rate_controller import controller
+from rate_controller import THROTTLE_STATUSES
+from rate_controller import parse_retry_after
+from retry_scheduler import RetryableError
+from retry_scheduler import RetryPolicy
+from retry_scheduler import RetryScheduler
+from retry_scheduler import classify_status
+from size_scheduler import plan_size_refresh
+from size_scheduler import record_size_change
+import json_codec
+from async_fetcher import fetch_all
+from browser_pool import BrowserPool
+from segment_discovery import discover_url_segment
+from segment_discovery import http_strategies
+from segment_discovery import SegmentManager
+from csv_handler import write_product_details_to_csv
+from csv_handler import parse_product_rows
 from utils import ensure_dir
 from utils import safe_filename
+from utils import content_hash
+from utils import canonical_url
+from utils import cache_key
+from utils import write_json_async
 
 
 logger = logging.getLogger(__name__)
 
+END_OF_STREAM = object()  # Queued once per consumer after the last downloaded payload
+
 # Network Monitoring and Dynamic URL Segment Extraction
 def setup_driver():
     caps = DesiredCapabilities.CHROME
@@ -34,6 +82,24 @@ def setup_driver():
     options.headless = True
     return uc.Chrome(desired_capabilities=caps, options=options)
 
+def create_pooled_driver():
+    """Driver factory for BrowserPool: performance logging for segment discovery, warmed on the homepage."""
+    driver = setup_driver()
+    enable_network_monitoring(driver)
+    driver.set_page_load_timeout(10)
+    navigate(driver, "https://simpletire.com/")
+    return driver
+
+def navigate(driver, url):
+    """Load url in the browser, paced by the shared rate controller like every HTTP request."""
+    ticket = controller.acquire()
+    status = None
+    try:
+        driver.get(url)
+        status = 200
+    finally:
+        controller.release(ticket, status, latency_target=RATE_BROWSER_LATENCY_P95_TARGET)
+
 def enable_network_monitoring(driver):
     driver.execute_cdp_cmd("Network.enable", {})
     driver.request_interceptor = lambda request: _request_interceptor(driver, request)
@@ -46,14 +112,13 @@ def _request_interceptor(driver, request):
             driver.execute_script("window.dynamicUrlSegment = arguments[0]", match.group(1))
 
 def extract_dynamic_url_segment(driver):
-    driver.get("https://simpletire.com/")
-    time.sleep(RATE_LIMIT)
+    navigate(driver, "https://simpletire.com/")
     return _parse_dynamic_url_segment_from_logs(driver)
 
 def _parse_dynamic_url_segment_from_logs(driver):
     logs = driver.get_log("performance")
     for entry in logs:
-        log = json.loads(entry["message"])["message"]
+        log = json_codec.loads(entry["message"])["message"]
         if log["method"] == "Network.responseReceived" and "_next/data/" in log["params"]["response"]["url"]:
             match = re.search(r'/_next/data/([^/]+)/index\.json', log["params"]["response"]["url"])
             if match:
@@ -92,7 +157,7 @@ def build_product_details_api_request_url(link_fragment, brand_label, product_li
     api_url = f"https://simpletire.com/api/product-detail?brand={brand_label}&productLine={product_line}&{link_fragment}"
     return api_url
 
-def get_or_update_url_segment(driver):
+def get_or_update_url_segment(browser_pool):
     with sqlite3.connect(DB_PATH) as conn:
         c = conn.cursor()
         c.execute("SELECT segment, last_fetched FROM url_segments ORDER BY last_fetched DESC LIMIT 1")
@@ -100,162 +165,481 @@ def get_or_update_url_segment(driver):
         if result and datetime.now() - datetime.strptime(result[1], '%Y-%m-%d %H:%M:%S') < timedelta(days=1):
             return result[0]
         else:
-            segment = extract_dynamic_url_segment(driver)
+            # Chrome is only started when the build ID cannot be read over plain HTTP
+            strategies = http_strategies() + [('chrome', lambda: browser_pool.run(extract_dynamic_url_segment))]
+            segment = discover_url_segment(strategies)
             if segment:
-                c.execute("INSERT OR REPLACE INTO url_segments (segment, last_fetched) VALUES (?, ?)", 
-                          (segment, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+                save_url_segment(segment)
             return segment
 
-def fetch_and_save_size_data(driver, dynamic_url_segment):
-    for size in SIZES:
+def rediscover_url_segment():
+    """Discover a fresh URL segment for SegmentManager and store it for later runs."""
+    # Pooled browsers may all be waiting on the result, so Chrome runs outside the pool
+    segment = discover_url_segment(http_strategies() + [('chrome', _extract_segment_with_new_driver)])
+    if segment:
+        save_url_segment(segment)
+    return segment
+
+def _extract_segment_with_new_driver():
+    driver = create_pooled_driver()
+    try:
+        return extract_dynamic_url_segment(driver)
+    finally:
+        driver.quit()
+
+def fetch_and_save_size_data(segment_manager, sizes=None):
+    """Refresh size pages, requeueing sizes that 404ed with a segment that has since been replaced.
+
+    Without sizes, refreshes the due sizes from plan_size_refresh, most
+    overdue first, and stops starting new ones once SIZE_REFRESH_TIME_BUDGET
+    is spent. Network errors, throttling and 5xx responses are retried with
+    backoff; sizes that use up their retry budget are recorded as dead letters.
+    Sizes that end without a refreshed page have the failure recorded.
+    """
+    retry_policy = RetryPolicy('size_data')
+    deadline = None
+    if sizes is None:
+        sizes = plan_size_refresh(SIZES)
+        if SIZE_REFRESH_TIME_BUDGET:
+            deadline = time.monotonic() + SIZE_REFRESH_TIME_BUDGET
+    validators = get_cache_validators(sizes, 'size_data', max_age_days=0)
+    links, _ = get_size_links()
+    previous_fragments = {size: {link[0] for link in size_links} for size, size_links in links.items()}
+    used_segments = {}
+    not_found = []
+    attempted, refreshed = set(), set()
+
+    def size_url(size):
+        async def resolve():
+            segment = await segment_manager.current_async()
+            used_segments[size] = segment
+            return f"https://simpletire.com/_next/data/{segment}/tire-sizes/{size}.json"
+        return resolve
+
+    def on_size_response(size, result):
+        if result.status == 404:
+            segment_manager.report_not_found(used_segments[size])
+            not_found.append(size)
+            return
+        if result.status in (200, 304):
+            segment_manager.report_success(used_segments[size])
+        etag, last_modified = result.headers.get('ETag'), result.headers.get('Last-Modified')
+        if result.status == 304:
+            touch_cache_entry('size_data', size, etag, last_modified)
+            refreshed.add(size)
+            if size in previous_fragments:
+                record_size_change(size, previous_fragments[size], previous_fragments[size])
+            logging.info(f"Size data for size {size} not modified")
+            return
+        if result.status != 200:
+            logging.error(f"Failed to fetch size data for size {size}: {result.status}")
+            return
+        # Hashing, decoding, compression and the file write would stall every request in flight on the loop
+        page_workers.submit(store_size_page, size, result.body, etag, last_modified)
+
+    def store_size_page(size, body, etag, last_modified):
+        body_hash = content_hash(body)
+        if size in validators and validators[size][2] == body_hash:
+            touch_cache_entry('size_data', size, etag, last_modified)
+            refreshed.add(size)
+            if size in previous_fragments:
+                record_size_change(size, previous_fragments[size], previous_fragments[size])
+            logging.info(f"Size data for size {size} unchanged")
+            return
+        try:
+            product_links = extract_product_links(json_codec.decode_size_page(body))
+        except ValueError as e:
+            logging.error(f"Invalid JSON in size data for size {size}: {e}")
+            return
         file_path = os.path.join(DATA_DIR, f"size_data_{size}.json")
-        with sqlite3.connect(DB_PATH) as conn:
-            c = conn.cursor()
-            c.execute("SELECT data FROM size_data WHERE size = ?", (size,))
-            result = c.fetchone()
-            if result and is_json_up_to_date(size, 'size_data'):
-                logging.info(f"Using cached size data for size {size}")
-                continue
+        try:
+            with open(file_path, 'wb') as file:
+                file.write(body)
+        except OSError as e:
+            logging.error(f"Error writing {file_path}: {e}")
+        save_size_data(size, body.decode('utf-8'), etag, last_modified, body_hash)
+        save_size_links(size, product_links)
+        refreshed.add(size)
+        if size in previous_fragments:
+            record_size_change(size, previous_fragments[size], {link[0] for link in product_links})
+        logging.info(f"Saved size data for size {size}")
+
+    def fetch_sizes(pending):
+        chunk_size = SIZE_REFRESH_CHUNK if deadline is not None else max(len(pending), 1)
+        for start in range(0, len(pending), chunk_size):
+            if deadline is not None and time.monotonic() >= deadline:
+                logging.info(f"Size refresh time budget spent, leaving {len(pending) - start} sizes for the next run")
+                return
+            chunk = pending[start:start + chunk_size]
+            attempted.update(chunk)
+            fetch_all([(size, size_url(size), http_client.conditional_headers(validators.get(size)))
+                       for size in chunk], on_size_response, retry_policy=retry_policy)
+
+    pending = sizes
+    with ThreadPoolExecutor(max_workers=SIZE_PAGE_WORKERS, thread_name_prefix='size-pages') as page_workers:
+        for _ in range(SEGMENT_MAX_REFRESHES + 1):
+            fetch_sizes(pending)
+            segment = segment_manager.current()  # Waits for a re-resolution started by the last responses
+            pending = [size for size in not_found if used_segments[size] != segment]
+            for size in not_found:
+                if used_segments[size] == segment:
+                    logging.error(f"Failed to fetch size data for size {size}: 404")
+            not_found.clear()
+            if not pending:
+                break
+            logging.info(f"Requeueing {len(pending)} sizes with URL segment {segment}")
+        else:
+            logging.error(f"Gave up on {len(pending)} sizes after {SEGMENT_MAX_REFRESHES} URL segment changes")
+    # Failing sizes are planned from their last failure, so they don't hold up due ones in later runs
+    for size in attempted:
+        if size in refreshed:
+            clear_size_failure(size)
+        else:
+            record_size_failure(size)
+    flush_cache_writes()
+
+def prepare_product_requests():
+    """Return one product-detail URL per canonical request across every size, in first-seen order.
+
+    Sizes whose top picks share a product line share its request: the
+    payload lists every size of the line, whichever size linked to it.
+    """
+    product_requests = {}
+    references = 0
+    for _, api_request_url in _iter_size_product_urls():
+        references += 1
+        product_requests.setdefault(canonical_url(api_request_url), api_request_url)
+    saved = references - len(product_requests)
+    logging.info(f"{references} product links across sizes map to {len(product_requests)} unique product requests "
+                 f"({saved} duplicate requests skipped)")
+    return list(product_requests.values())
+
+def _iter_size_product_urls():
+    size_links, missing = get_size_links()
+    if missing:
+        size_links.update(_backfill_size_links(missing))
 
-            size_url = f"https://simpletire.com/_next/data/{dynamic_url_segment}/tire-sizes/{size}.json"
-            try:
-                response = requests.get(size_url)
-                if response.status_code == 200:
-                    json_data = response.json()
-                    with open(file_path, 'w') as file:
-                        json.dump(json_data, file)
-                    c.execute("REPLACE INTO size_data (size, last_fetched, data) VALUES (?, ?, ?)",
-                              (size, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), json.dumps(json_data)))
-                    logging.info(f"Saved size data for size {size}")
-                else:
-                    logging.error(f"Failed to fetch size data for size {size}: {response.status_code}")
-            except requests.RequestException as e:
-                logging.error(f"Request error while fetching size data for size {size}: {e}")
-
-def prepare_product_details_api_request_urls():
-    product_details_api_request_urls = []
+    for size in SIZES:
+        if size not in size_links:
+            logging.error(f"Size data not found in database for size {size}")
+            continue
+        for link_fragment, brand_label, product_line in size_links[size]:
+            yield size, build_product_details_api_request_url(link_fragment, brand_label, product_line)
+
+def _backfill_size_links(sizes):
+    """Extract and store links for size pages cached before the size_links table existed."""
+    logging.info(f"Extracting product links from {len(sizes)} cached size pages")
+    size_links = {}
     with sqlite3.connect(DB_PATH) as conn:
         c = conn.cursor()
-        for size in SIZES:
+        for size in sizes:
             c.execute("SELECT data FROM size_data WHERE size = ?", (size,))
             result = c.fetchone()
-            if result:
-                json_data = json.loads(result[0])
-                product_details = extract_product_links(json_data)
-
-                for details in product_details:
-                    link_fragment, brand_label, product_line = details
-                    api_request_url = build_product_details_api_request_url(link_fragment, brand_label, product_line)
-                    product_details_api_request_urls.append(api_request_url)
-            else:
-                logging.error(f"Size data not found in database for size {size}")
+            if result is None:
+                continue
+            try:
+                product_links = extract_product_links(json_codec.decode_size_page(decode_payload(result[0])))
+            except ValueError as e:
+                logging.error(f"Invalid JSON in cached size data for size {size}: {e}")
+                continue
+            save_size_links(size, product_links)
+            size_links[size] = product_links
+    flush_cache_writes()
+    return size_links
+
 
-    return product_details_api_request_urls
+def fetch_product_details_over_http(urls, directory_name, on_fetched=None):
+    """Fetch product details over HTTP with retries; on_fetched(url) runs for every URL now fresh in the cache."""
+    validators = get_cache_validators(urls, 'product_details')
 
+    def on_done(url, fetched):
+        if fetched and on_fetched is not None:
+            on_fetched(url)
 
-def fetch_and_save_product_details(url, directory_name):
+    # The rate controller decides how many of these workers may have a request in flight
+    with ThreadPoolExecutor(max_workers=RATE_CONCURRENCY_MAX) as executor:
+        with RetryScheduler(RetryPolicy('product_details'), executor.submit) as retries:
+            for url in urls:
+                retries.submit(url, fetch_and_save_product_details, url, directory_name, validators.get(url),
+                               on_done=on_done)
+    flush_cache_writes()
+
+def fetch_and_save_product_details(url, directory_name, validators=None):
+    """Fetch one product over HTTP into the cache; returns True when the cache now holds a fresh payload.
+
+    Raises RetryableError for network errors, throttling and 5xx responses.
+    """
     ensure_dir(directory_name)
     file_name = safe_filename(url)
     file_path = os.path.join(directory_name, file_name)
 
-    with sqlite3.connect(DB_PATH) as conn:
-        c = conn.cursor()
-        c.execute("SELECT data FROM product_details WHERE url = ?", (url,))
-        result = c.fetchone()
-        if result and is_json_up_to_date(url, 'product_details'):
-            logging.info(f"Using cached product details for URL {url}")
-            return
-
-        try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                json_data = response.json()
-                with open(file_path, 'w') as file:
-                    json.dump(json_data, file)
-                c.execute("REPLACE INTO product_details (url, last_fetched, data) VALUES (?, ?, ?)",
-                          (url, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), json.dumps(json_data)))
-                logging.info(f"Saved product details for URL {url}")
-            else:
-                logging.error(f"Failed to fetch product details for URL {url}: {response.status_code}")
-        except requests.RequestException as e:
-            logging.error(f"Request error while fetching product details for URL {url}: {e}")
+    try:
+        response = http_client.get(url, headers=http_client.conditional_headers(validators))
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if response.status_code == 304:
+            touch_cache_entry('product_details', url, etag, last_modified)
+            logging.info(f"Product details for URL {url} not modified")
+            return True
+        elif response.status_code == 200:
+            body_hash = content_hash(response.content)
+            if validators and validators[2] == body_hash:
+                touch_cache_entry('product_details', url, etag, last_modified)
+                logging.info(f"Product details for URL {url} unchanged")
+                return True
+            json_data = json_codec.loads(response.content)
+            if SAVE_RAW_JSON:
+                write_json_async(file_path, json_data)
+            save_product_details(url, json_codec.dumps(json_data), etag, last_modified, body_hash)
+            logging.info(f"Saved product details for URL {url}")
+            return True
+        error_class = classify_status(response.status_code)
+        if error_class is not None:
+            raise RetryableError(error_class, parse_retry_after(response.headers.get('Retry-After')),
+                                 f"HTTP {response.status_code}")
+        logging.error(f"Failed to fetch product details for URL {url}: {response.status_code}")
+    except http_client.RequestException as e:
+        raise RetryableError('network', detail=str(e))
+    return False
 
 # Main Scraping Function
-def scrape_and_save_json(links, directory_name, downloaded_files, scraping_completed_flag):
-    ensure_dir(directory_name)
-    options = uc.ChromeOptions()
-    options.headless = True
-    dynamic_url_segment = None
-
-    with uc.Chrome(options=options) as driver:
-        enable_network_monitoring(driver)
-        driver.set_page_load_timeout(10)
-        driver.get("https://simpletire.com/")
-        time.sleep(RATE_LIMIT)
-
-        counter = 1
-
-        for link in links:
-            success = False
-            attempts = 0
-
-            while not success and attempts < SCRAPE_ATTEMPTS:
-                try:
-                    # Check if the link is for the _next/data endpoint
-                    if '_next/data/' in link:
-                        if dynamic_url_segment is None:
-                            dynamic_url_segment = extract_dynamic_url_segment(driver)
-
-                        if dynamic_url_segment is None:
-                            logging.error("Failed to extract dynamic URL segment. Retrying...")
-                            attempts += 1
-                            continue
-
-                        modified_link = link.replace("DYNAMIC_SEGMENT", dynamic_url_segment)
-                        response = requests.get(modified_link)
-                        if response.status_code == 200:
-                            parsed_json = response.json()
-                        else:
-                            logging.error(f"Error fetching data: {response.status_code}")
-                            dynamic_url_segment = None  # Reset segment to trigger re-fetch
-                            continue
-
-                    else:
-                        driver.get(link)
-                        json_response = driver.find_element('tag name', 'pre').text
-                        parsed_json = json.loads(json_response)
-
-                    # Save the JSON response
-                    file_path = os.path.join(directory_name, f"{counter}.json")
-                    with open(file_path, 'w') as output:
-                        json.dump(parsed_json, output)
-                    downloaded_files.append(file_path)
-                    success = True
-
-                except TimeoutException:
-                    logging.error(f"Timeout occurred for {link}. Retrying... (Attempt {attempts + 1})")
-                    attempts += 1
-                
-                except (NoSuchElementException, requests.RequestException) as e:
-                    logging.error(f"Error occurred for {link}: {e}. Retrying... (Attempt {attempts + 1})")
-                    attempts += 1
-
-            counter += 1
-
-    scraping_completed_flag[0] = True
+def scrape_and_save_json(indexed_links, directory_name, downloaded_files, consumer_count=1, browser_pool=None,
+                         use_cache=False, journal=None, segment_manager=None):
+    """Queue (index, link, raw_json) for every (index, link) for the CSV stage.
+
+    An entry is queued for every link in index order, with raw_json None
+    when all attempts failed, so every consumer setup writes the same rows
+    in the same order. With use_cache, links whose product details are
+    fresh in the cache (fetched over HTTP earlier in the run or in a
+    previous one) are read from the database and only the rest go through
+    the browser. Browser results are cached too and, with a journal,
+    recorded as fetched or failed.
+    """
+    try:
+        links = [link for _, link in indexed_links]
+        if use_cache:
+            browser_links = set(get_stale_identifiers(links, 'product_details'))
+            logging.info(f"{len(links) - len(browser_links)} product details served from cache, "
+                         f"{len(browser_links)} need the browser")
+        else:
+            browser_links = set(links)
+        browser_items = [item for item in indexed_links if item[1] in browser_links]
+        finished = queue.Queue()
+        if not browser_items:
+            _queue_in_order(indexed_links, browser_links, finished, downloaded_files)
+        elif browser_pool is None:
+            with BrowserPool(create_pooled_driver) as browser_pool, \
+                    _scrape_links(browser_items, directory_name, browser_pool, finished, journal, segment_manager):
+                _queue_in_order(indexed_links, browser_links, finished, downloaded_files)
+        else:
+            with _scrape_links(browser_items, directory_name, browser_pool, finished, journal, segment_manager):
+                _queue_in_order(indexed_links, browser_links, finished, downloaded_files)
+    finally:
+        # One sentinel per consumer so every process_downloaded_files thread exits
+        for _ in range(consumer_count):
+            downloaded_files.put(END_OF_STREAM)
     logging.info("Scraping completed.")
 
+def _queue_in_order(indexed_links, browser_links, finished, downloaded_files, chunk_size=500):
+    """Queue cached payloads and the browser results put on finished as (index, link, raw_json), in index order.
+
+    Cached payloads are read a chunk at a time; browser results that
+    finish ahead of their turn wait in a dict until it comes.
+    """
+    arrived = {}
+    for start in range(0, len(indexed_links), chunk_size):
+        chunk = indexed_links[start:start + chunk_size]
+        payloads = load_product_payloads(link for _, link in chunk if link not in browser_links)
+        for index, link in chunk:
+            if link in browser_links:
+                while index not in arrived:
+                    result_index, _, raw_json = finished.get()
+                    arrived[result_index] = raw_json
+                raw_json = arrived.pop(index)
+            else:
+                raw_json = payloads.get(link)
+                if raw_json is None:
+                    logging.error(f"Cached product details disappeared for {link}")
+            downloaded_files.put((index, link, raw_json))  # Blocks while the CSV stage is behind
+
+def _scrape_links(indexed_links, directory_name, browser_pool, finished, journal=None, segment_manager=None):
+    """Start fetching indexed_links in the browser and return the RetryScheduler running them.
+
+    Each result is cached and journaled as soon as it finishes, then put
+    on finished as (index, link, raw_json); closing the scheduler waits
+    for the rest.
+    """
+    ensure_dir(directory_name)
+    if segment_manager is None:
+        segment_manager = SegmentManager(rediscover_url_segment)  # Resolved on first use
+    policy = RetryPolicy('product_details')
+    retries = RetryScheduler(policy, browser_pool.submit)
+
+    def link_done(index, link, raw_json):
+        # JSON is decoded by the CSV stage, which may run in worker processes
+        if raw_json is not None:
+            save_product_details(link, raw_json, content_hash=content_hash(raw_json.encode('utf-8')))
+            if SAVE_RAW_JSON:
+                write_json_async(os.path.join(directory_name, safe_filename(link)), raw_json)
+        if journal is not None:
+            if raw_json is not None:
+                journal.mark([index], journal.FETCHED, cache_key(link))
+            else:
+                journal.mark([index], journal.FAILED)
+        finished.put((index, link, raw_json))
+
+    def batch_done(batch, results):
+        for index, link, raw_json in results or [(index, link, None) for index, link in batch]:
+            if raw_json is not None:
+                policy.settled(link)
+                link_done(index, link, raw_json)
+            else:
+                # Failed batch entries fall back to navigation, retried with backoff from here on
+                retries.submit(link, _scrape_link, link, segment_manager, on_done=partial(link_done, index))
+
+    if BROWSER_FETCH_MODE == 'batch':
+        # _next/data links are fetched over plain HTTP anyway, so only API links are batched
+        batchable = [item for item in indexed_links if '_next/data/' not in item[1]]
+        single = [item for item in indexed_links if '_next/data/' in item[1]]
+        for i in range(0, len(batchable), BROWSER_FETCH_BATCH_SIZE):
+            batch = batchable[i:i + BROWSER_FETCH_BATCH_SIZE]
+            retries.submit(f"batch starting at {batch[0][1]}", _scrape_batch, batch,
+                           on_done=lambda _, results, batch=batch: batch_done(batch, results))
+    else:
+        single = indexed_links
+    for index, link in single:
+        retries.submit(link, _scrape_link, link, segment_manager, on_done=partial(link_done, index))
+    return retries
+
+_FETCH_BATCH_SCRIPT = """
+const urls = arguments[0];
+const done = arguments[arguments.length - 1];
+Promise.all(urls.map(url => fetch(url, {credentials: 'include', headers: {'Accept': 'application/json'}})
+    .then(response => response.ok ? response.text().then(text => [response.status, text]) : [response.status, null])
+    .catch(error => [0, String(error)])))
+  .then(done);
+"""
+
+def _scrape_batch(driver, batch):
+    """Fetch a batch of (index, link) with fetch() calls inside the already loaded simpletire.com page.
+
+    Returns (index, link, raw_json) for every link, with raw_json None where the in-page fetch failed.
+    """
+    driver.set_script_timeout(BROWSER_FETCH_SCRIPT_TIMEOUT)
+    ticket = controller.acquire(cost=len(batch))
+    try:
+        responses = driver.execute_async_script(_FETCH_BATCH_SCRIPT, [link for _, link in batch])
+    except (TimeoutException, WebDriverException) as e:
+        logging.error(f"In-browser fetch of {len(batch)} links failed: {e}")
+        responses = [(0, None)] * len(batch)
+    controller.release(ticket, _batch_status([status for status, _ in responses]), cost=len(batch))
+
+    results = []
+    for (index, link), (status, text) in zip(batch, responses):
+        if status == 200 and text is not None:
+            results.append((index, link, text))
+        else:
+            logging.error(f"In-browser fetch failed for {link}: {status} {text or ''}. Falling back to navigation")
+            results.append((index, link, None))
+    return results
+
+def _batch_status(statuses):
+    """Summarise a batch for the rate controller: throttled, failed or fine."""
+    for status in statuses:
+        if status in THROTTLE_STATUSES:
+            return status
+    if any(not status or status >= 500 for status in statuses):
+        return None
+    return 200
+
+def _scrape_link(driver, link, segment_manager):
+    """Make one attempt at a link on a pooled driver.
+
+    Returns the raw JSON text, None if retrying cannot help, or raises
+    RetryableError for the RetryScheduler to try again later.
+    """
+    # Check if the link is for the _next/data endpoint
+    if '_next/data/' in link:
+        dynamic_url_segment = segment_manager.current()
+        if dynamic_url_segment is None:
+            raise RetryableError('segment', detail="no dynamic URL segment")
+
+        modified_link = link.replace("DYNAMIC_SEGMENT", dynamic_url_segment)
+        try:
+            response = http_client.get(modified_link)
+        except http_client.RequestException as e:
+            raise RetryableError('network', detail=str(e))
+        if response.status_code == 200:
+            segment_manager.report_success(dynamic_url_segment)
+            return response.text
+        if response.status_code == 404:
+            segment_manager.report_not_found(dynamic_url_segment)
+            if segment_manager.current() != dynamic_url_segment:
+                raise RetryableError('segment', detail=f"URL segment changed to {segment_manager.current()}")
+        error_class = classify_status(response.status_code)
+        if error_class is None:
+            logging.error(f"Error fetching data for {link}: {response.status_code}")
+            return None
+        raise RetryableError(error_class, parse_retry_after(response.headers.get('Retry-After')),
+                             f"HTTP {response.status_code}")
+
+    try:
+        navigate(driver, link)
+        return driver.find_element('tag name', 'pre').text
+    except WebDriverException as e:  # Includes timeouts and a missing <pre> element
+        raise RetryableError('browser', detail=f"{type(e).__name__}: {e}")
+
 # Processing Downloaded Files
-def process_downloaded_files(downloaded_files, csv_file_path, scraping_completed_flag):
+def create_download_queue():
+    return queue.Queue(maxsize=DOWNLOAD_QUEUE_SIZE)
+
+def process_downloaded_files(downloaded_files, output_sink):
     logging.info("Started processing downloaded files.")
-    while not scraping_completed_flag[0] or downloaded_files:
-        if downloaded_files:
-            json_file = downloaded_files.pop(0)
-            extract_product_details_data_and_write_to_csv(json_file, csv_file_path)
-        else:
-            time.sleep(1)
+    while True:
+        item = downloaded_files.get()
+        if item is END_OF_STREAM:
+            break
+        index, link, raw_json = item
+        if raw_json is not None:
+            write_product_details_to_csv(raw_json, output_sink, link, index)
+    logging.info("Finished processing all downloaded files.")
+
+def process_downloaded_files_in_pool(downloaded_files, output_sink, workers, indices):
+    """Extract rows in a process pool and write them in the order of indices.
+
+    indices lists every index the producer will queue; the output matches
+    process_downloaded_files with a single consumer fed in that order.
+    """
+    logging.info(f"Started processing downloaded files with {workers} extraction processes.")
+    pending = {}
+    order = deque(sorted(indices))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            item = downloaded_files.get()
+            if item is END_OF_STREAM:
+                break
+            index, link, raw_json = item
+            pending[index] = (link, pool.submit(parse_product_rows, raw_json) if raw_json is not None else None)
+            _write_rows_in_order(pending, order, output_sink, wait=len(pending) >= workers * EXTRACT_BACKLOG_PER_PROCESS)
+        _write_rows_in_order(pending, order, output_sink, wait=True)
+        if pending:  # Only reached if the producer queued an unexpected index
+            _write_rows_in_order(pending, deque(sorted(pending)), output_sink, wait=True)
     logging.info("Finished processing all downloaded files.")
 
+def _write_rows_in_order(pending, order, output_sink, wait):
+    while order and order[0] in pending:
+        index = order[0]
+        link, future = pending[index]
+        if future is not None:
+            if not wait and not future.done():
+                break
+            try:
+                output_sink.write_rows(future.result(), index)
+                logging.info(f"Data from {link} written to CSV.")
+            except Exception as e:
+                logging.error(f"Error writing rows for {link}: {e}")
+        del pending[index]
+        order.popleft()
+
 # Test Function for Dynamic URL Segment
 def test_fetch_dynamic_url_segment():
     driver = setup_driver()
@@ -0,0 +1,162 @@
+from concurrent.futures import Future
+import re
+import time
+import asyncio
+import threading
+import logging
+
+from config import SEGMENT_NOT_FOUND_THRESHOLD
+import http_client
+
+
+logger = logging.getLogger(__name__)
+
+HOMEPAGE_URL = "https://simpletire.com/"
+HTML_HEADERS = {'Accept': 'text/html,application/xhtml+xml'}
+
+_NEXT_DATA_RE = re.compile(r'<script[^>]*id="__NEXT_DATA__"[^>]*>(.*?)</script>', re.S)
+_BUILD_ID_RE = re.compile(r'"buildId"\s*:\s*"([^"]+)"')
+_BUILD_MANIFEST_RE = re.compile(r'/_next/static/([^/"\']+)/_buildManifest\.js')
+
+def fetch_homepage():
+    """Fetch the homepage HTML over plain HTTP, or return None if it is not served to us."""
+    try:
+        response = http_client.get(HOMEPAGE_URL, headers=HTML_HEADERS)
+    except http_client.RequestException as e:
+        logging.warning(f"Request error while fetching the homepage: {e}")
+        return None
+    if response.status_code != 200:
+        logging.warning(f"Failed to fetch the homepage: {response.status_code}")
+        return None
+    return response.text
+
+def build_id_from_next_data(html):
+    """Read buildId from the page's __NEXT_DATA__ script without decoding the whole payload."""
+    match = _NEXT_DATA_RE.search(html or '')
+    if not match:
+        return None
+    build_id = _BUILD_ID_RE.search(match.group(1))
+    return build_id.group(1) if build_id else None
+
+def build_id_from_build_manifest(html):
+    """Read the build ID from the /_next/static/<buildId>/_buildManifest.js asset path."""
+    match = _BUILD_MANIFEST_RE.search(html or '')
+    return match.group(1) if match else None
+
+def http_strategies():
+    """Strategies that read the build ID from a single plain HTTP fetch of the homepage."""
+    page = {}
+
+    def homepage():
+        if 'html' not in page:
+            page['html'] = fetch_homepage()
+        return page['html']
+
+    return [
+        ('next_data', lambda: build_id_from_next_data(homepage())),
+        ('build_manifest', lambda: build_id_from_build_manifest(homepage())),
+    ]
+
+def discover_url_segment(strategies):
+    """Run (name, strategy) pairs in order and return the first segment found, or None.
+
+    Logs which strategy won and how long it and the whole chain took.
+    """
+    started = time.monotonic()
+    for name, strategy in strategies:
+        strategy_started = time.monotonic()
+        try:
+            segment = strategy()
+        except Exception as e:
+            logging.warning(f"URL segment strategy {name} failed: {e}")
+            segment = None
+        elapsed = time.monotonic() - strategy_started
+        if segment:
+            logging.info(f"URL segment {segment} found by {name} in {elapsed:.2f}s "
+                         f"({time.monotonic() - started:.2f}s total)")
+            return segment
+        logging.info(f"URL segment strategy {name} found nothing in {elapsed:.2f}s")
+    logging.error(f"No URL segment strategy succeeded after {time.monotonic() - started:.2f}s")
+    return None
+
+class SegmentManager:
+    """Shared, thread-safe owner of the current _next/data URL segment.
+
+    Fetchers report 404s against the segment they used. After
+    not_found_threshold 404s in a row for the current segment it is
+    re-resolved once, in the background; meanwhile current() and
+    current_async() wait, so workers pause and then resume with the new
+    segment. A segment that re-resolves to itself is not checked again.
+    """
+
+    def __init__(self, discover, segment=None, not_found_threshold=SEGMENT_NOT_FOUND_THRESHOLD):
+        self.discover = discover
+        self.not_found_threshold = not_found_threshold
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._segment = segment
+        self._not_found = 0
+        self._confirmed = set()
+        self._resolving = None
+        self._resolved_once = segment is not None
+
+    def current(self):
+        """Return the current segment, waiting while it is being resolved."""
+        resolving = self._pending_resolution()
+        if resolving is not None:
+            resolving.result()
+        return self._segment
+
+    async def current_async(self):
+        resolving = self._pending_resolution()
+        if resolving is not None:
+            await asyncio.wrap_future(resolving)
+        return self._segment
+
+    def report_success(self, segment):
+        with self._lock:
+            if segment == self._segment:
+                self._not_found = 0
+
+    def report_not_found(self, segment):
+        """Record a 404 for a URL built with segment, re-resolving it once 404s pile up."""
+        with self._lock:
+            if segment != self._segment or self._resolving is not None or segment in self._confirmed:
+                return
+            self._not_found += 1
+            if self._not_found >= self.not_found_threshold:
+                logging.warning(f"{self._not_found} _next/data requests returned 404 with URL segment {segment}, "
+                                f"re-resolving it")
+                self._start_resolution()
+
+    def _pending_resolution(self):
+        with self._lock:
+            if self._segment is None and not self._resolved_once and self._resolving is None:
+                self._start_resolution()
+            return self._resolving
+
+    def _start_resolution(self):
+        self._resolved_once = True
+        self._resolving = Future()
+        threading.Thread(target=self._resolve, args=(self._resolving, self._segment), daemon=True).start()
+
+    def _resolve(self, resolving, old_segment):
+        try:
+            segment = self.discover()
+        except Exception as e:
+            logging.error(f"Error while resolving the URL segment: {e}")
+            segment = None
+        with self._lock:
+            if segment and segment != old_segment:
+                self._segment = segment
+                self.refreshes += 1
+                logging.info(f"URL segment changed from {old_segment} to {segment}")
+            elif old_segment:
+                self._confirmed.add(old_segment)  # Stop re-resolving it for 404s that are real
+                if segment:
+                    logging.info(f"URL segment {old_segment} is still current")
+                else:
+                    logging.error(f"Could not re-resolve URL segment, keeping {old_segment}")
+            self._not_found = 0
+            self._resolving = None
+        resolving.set_result(self._segment)
@@ -0,0 +1,69 @@
+from datetime import datetime
+import logging
+
+from config import CACHE_DURATION_DAYS
+from config import SIZE_REFRESH_MIN_DAYS
+from config import SIZE_REFRESH_MAX_DAYS
+from config import SIZE_VOLATILITY_SMOOTHING
+from config import SIZE_REFRESH_MAX_REQUESTS
+from database import get_size_refresh_state
+from database import get_size_failures
+from database import update_size_volatility
+
+
+logger = logging.getLogger(__name__)
+
+def refresh_interval(volatility):
+    """Days between refreshes of a size; None (no history yet) falls back to CACHE_DURATION_DAYS."""
+    if volatility is None:
+        return CACHE_DURATION_DAYS
+    return SIZE_REFRESH_MAX_DAYS - (SIZE_REFRESH_MAX_DAYS - SIZE_REFRESH_MIN_DAYS) * min(1.0, volatility)
+
+def failure_interval(failures):
+    """Days before retrying a size after failures failed refreshes in a row, doubling up to SIZE_REFRESH_MAX_DAYS."""
+    return min(SIZE_REFRESH_MAX_DAYS, SIZE_REFRESH_MIN_DAYS * 2 ** (failures - 1))
+
+def _age_days(now, timestamp):
+    return (now - datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')).total_seconds() / 86400
+
+def plan_size_refresh(sizes, max_requests=SIZE_REFRESH_MAX_REQUESTS, now=None):
+    """Return the sizes due for a refresh, most overdue first, capped at max_requests.
+
+    A size's priority is its age divided by its refresh interval, which
+    shrinks as its top picks change more often; sizes never fetched come
+    first. A size whose last refreshes failed (e.g. it 404s or is
+    dead-lettered) is timed from its last failure with failure_interval
+    instead, so it cannot starve due sizes. Sizes past the cap stay due
+    and lead the next run.
+    """
+    now = now or datetime.now()
+    state = get_size_refresh_state()
+    failed = get_size_failures()
+    due = []
+    for size in sizes:
+        last_fetched, volatility = state.get(size, (None, None))
+        if size in failed:
+            failures, last_failed = failed[size]
+            priority = _age_days(now, last_failed) / failure_interval(failures)
+        elif last_fetched is None:
+            priority = float('inf')
+        else:
+            priority = _age_days(now, last_fetched) / refresh_interval(volatility)
+        if priority >= 1:
+            due.append((priority, size))
+    due.sort(key=lambda item: item[0], reverse=True)
+    planned = [size for _, size in due]
+    if max_requests is not None:
+        planned = planned[:max_requests]
+    logging.info(f"{len(due)} of {len(sizes)} sizes are due for a refresh, refreshing {len(planned)}")
+    return planned
+
+def top_picks_change(old_fragments, new_fragments):
+    """Share of top picks that differ between two fetches (Jaccard distance of their link fragments)."""
+    union = old_fragments | new_fragments
+    if not union:
+        return 0.0
+    return 1 - len(old_fragments & new_fragments) / len(union)
+
+def record_size_change(size, old_fragments, new_fragments):
+    update_size_volatility(size, top_picks_change(old_fragments, new_fragments), SIZE_VOLATILITY_SMOOTHING)
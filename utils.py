@@ -1,7 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+from urllib.parse import urlunsplit
 import os
+import atexit
 import hashlib
+import threading
 import logging
 
+import json_codec
+
 
 logger = logging.getLogger(__name__)
 
@@ -9,7 +18,59 @@ def ensure_dir(directory):
     os.makedirs(directory, exist_ok=True)
 
 def safe_filename(url):
-    """Create a safe and shorter filename from a URL."""
-    url_hash = hashlib.md5(url.encode('utf-8')).hexdigest()
-    return url_hash + '.json'
+    """Create a safe and shorter filename from a URL, shared by every URL with the same cache key."""
+    return cache_key(url) + '.json'
+
+
+# Query params that only record where a link was shown; the product-detail API ignores them
+TRACKING_PARAMS = frozenset({'curationPos', 'curationSeq', 'curationSource', 'pageSource', 'productPos'})
+# Query params that pick one size of the product line; the payload lists every size of the line either way
+SIZE_PARAMS = frozenset({'tireSize', 'mpn'})
+
+def canonical_url(url):
+    """Drop tracking and size params and sort the rest, so requests for the same product line compare equal."""
+    parts = urlsplit(url)
+    params = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                    if name not in TRACKING_PARAMS and name not in SIZE_PARAMS)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(params), ''))
+
+def _fast_hash(data):
+    # Always blake2b: keys and hashes are persisted, so they must not depend on which packages are installed
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def cache_key(url):
+    """Key a product-detail URL by its canonical form, for both the cache table and file names."""
+    return _fast_hash(canonical_url(url).encode('utf-8'))
+
+def content_hash(body):
+    """Hash a response body so unchanged payloads can be detected without comparing them."""
+    return _fast_hash(body)
+
+_json_writer = None
+_json_writer_lock = threading.Lock()
+
+def _write_json(file_path, data):
+    try:
+        with open(file_path, 'w') as file:
+            if isinstance(data, str):
+                file.write(data)  # Already serialized
+            else:
+                json_codec.dump(data, file)
+    except (OSError, TypeError, ValueError) as e:
+        logging.error(f"Error writing JSON file {file_path}: {e}")
+
+def write_json_async(file_path, data):
+    """Write data (an object or a JSON string) on a background thread so the caller does not wait on the filesystem."""
+    global _json_writer
+    with _json_writer_lock:
+        if _json_writer is None:
+            _json_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='json-writer')
+            atexit.register(wait_for_json_writes)
+        _json_writer.submit(_write_json, file_path, data)
 
+def wait_for_json_writes():
+    global _json_writer
+    with _json_writer_lock:
+        writer, _json_writer = _json_writer, None
+    if writer is not None:
+        writer.shutdown(wait=True)